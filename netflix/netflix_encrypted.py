@@ -154,6 +154,8 @@ outcome = list(s.find_nested([['customerid', 0, AID_ctL],['date', s.RANGE_OP, [s
 ipython.magic("timeit list(s.find_nested([['customerid', 0, AID_ctL],['date', s.RANGE_OP, [start_date_ctL, end_date_ctL]]], return_ids = True))")
 ratings = [int(x["rating"]["h_add"]) for x in outcome]
 ipython.magic("timeit reduce(lambda x,y: x*y % n2, ratings)")
+# The same sum, computed by the server
+ipython.magic("timeit s.aggregate_sum([['customerid', 0, AID_ctL],['date', s.RANGE_OP, [start_date_ctL, end_date_ctL]]], 'rating.h_add')")
 
 # 
 # Equation 4: Average of ratings for a particular movie M in a timeset
@@ -166,6 +168,8 @@ outcome = list(s.find_nested([['movieid', 0, MID_ctL],['date', s.RANGE_OP, [star
 ipython.magic("timeit list(s.find_nested([['movieid', 0, MID_ctL],['date', s.RANGE_OP, [start_date_ctL, end_date_ctL]]], return_ids = True))")
 ratings = [int(x["rating"]["h_add"]) for x in outcome]
 ipython.magic("timeit reduce(lambda x,y: x*y % n2, ratings)")
+# The same sum, computed by the server
+ipython.magic("timeit s.aggregate_sum([['movieid', 0, MID_ctL],['date', s.RANGE_OP, [start_date_ctL, end_date_ctL]]], 'rating.h_add')")
 
 #
 # Equation 5: Number of days since Alice's first rating
@@ -176,6 +180,7 @@ print "Equation 5:"
 ipython.magic("timeit list(s.find( index = AID_ctL, iname = 'customerid', projection = ['date', 'customerid']))")
 outcome = list(s.find( index = AID_ctL, iname = "customerid", projection = ["date", "customerid"]))
 ipython.magic("timeit outcome.sort(cmp = lambda x, y: client.ciphers['index'].compare(x['date']['index'][0],y['date']['index'][1]))")
+ipython.magic("timeit [outcome[i] for i in client.ciphers['index'].argsort([x['date']['index'] for x in outcome])]")
 
 #
 # Equation 6: Quantity of users who hated M
@@ -186,9 +191,10 @@ print "Equation 6:"
 ore_compare = lambda x, y: client.ciphers["index"].compare(x,y)
 outcome = s.find( index = MID_ctL, iname = "movieid", projection = ["rating"] )
 
-ipython.magic("timeit s.find( index = MID_ctL, iname = 'movieid', projection = ['rating'] )")
+ipython.magic("timeit list(s.find( index = MID_ctL, iname = 'movieid', projection = ['rating'] ))")
 hold = [client.get_ctR(parse(client.decrypt(x))["rating"]) for x in outcome]
 ipython.magic("timeit sum([1 if (ore_compare(rate_hated, enc_rate) == 1) else 0 for enc_rate in hold])")
+ipython.magic("timeit client.ciphers['index'].compare_many(rate_hated, hold).count(1)")
 # ipython.magic("timeit sum([1 if (ore_compare(rate_hated, enc_rate["rating"]["index"]) == 1) else 0 for enc_rate in outcome])")
 
 #
@@ -197,8 +203,9 @@ ipython.magic("timeit sum([1 if (ore_compare(rate_hated, enc_rate) == 1) else 0
 # Get all users that rated M and compare to rate_loved
 #
 print "Equation 7:"
-ipython.magic("timeit s.find( index = MID_ctL, iname = 'movieid', projection = ['rating'] )")
-ipython.magic("timeit sum([1 if (ore_compare(rate_loved, enc_rate['rating']['index']) == -1) else 0 for enc_rate in outcome])")
+ipython.magic("timeit list(s.find( index = MID_ctL, iname = 'movieid', projection = ['rating'] ))")
+ipython.magic("timeit sum([1 if (ore_compare(rate_loved, enc_rate) == -1) else 0 for enc_rate in hold])")
+ipython.magic("timeit client.ciphers['index'].compare_many(rate_loved, hold).count(-1)")
 
 #
 # Equation 9: Users similar to Alice
@@ -213,17 +220,18 @@ def similarity_set(A, B):
 				C.append([x["rating"]["h_add"], y["rating"]["h_add"]])
 	return C
 
-A = s.find(
+# similarity_set goes over A once for each element of B
+A = list(s.find(
 	index = AID_ctL,
 	iname = "customerid",
 	projection = ["movieid","rating"]
-	)
+	))
 
-B = s.find(
+B = list(s.find(
 	index = BID_ctL,
 	iname = "customerid",
 	projection = ["movieid", "rating"]
-	)
+	))
 ipython.magic("timeit s.find( index = AID_ctL, iname = 'customerid', projection = ['movieid','rating'], return_ids = True )")
 ipython.magic("timeit s.find( index = BID_ctL, iname = 'customerid', projection = ['movieid','rating'], return_ids = True )")
 
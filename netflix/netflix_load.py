@@ -164,7 +164,6 @@ def main():
     # Setup client
     start = time.time()
     client = Client(Client.keygen())
-    client.ciphers["h_add"].rating_cts = [client.ciphers["h_add"].encrypt(m) for m in range(6)]
     with open(okeys, "wb") as f:
         print client.keys
         json.dump(client.keys, f)    
@@ -181,7 +180,10 @@ def main():
     client.add_attr(attribute = "index", name = "movieid")
     client.add_attr(attribute = "index", name = "date")
     client.add_attr(attribute = "index", name = "rating")
-    client.add_attr(attribute = "h_add", name = "rating")
+    # Ratings go from 0 to 5
+    client.add_attr(attribute = "h_add", name = "rating", domain = range(6))
+    # No randomness pool is started: the documents are encrypted by worker
+    # processes, which receive the client pickled without it.
 
     # 
     # Encrypted documents with this setup will contain AES ciphertexts for 
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# Per-node overhead of the work queue used to walk an index tree.
+#
+# Both traversals below visit every node of a local, complete binary tree
+# whose nodes have the same shape as the ones stored in references_<collection>.
+# The first one uses multiprocessing.Queue, as SecMongo.find did before, and
+# the second one uses the level-synchronous frontier of SecMongo.__walk_index.
+#
+# py.test frontier.py --benchmark-warmup=on --benchmark-disable-gc
+#
+from multiprocessing import Queue
+import random
+import pytest
+
+NNODES = 1023 # A complete tree of height 10
+
+def build_tree(nnodes):
+    # A ctR for n = 32 and k = 8 has 16 + 4*64 = 272 bytes
+    tree = {}
+    for i in range(nnodes):
+        tree[i] = {
+            "iname_id": i,
+            "references": [random.randint(0, 10**6) for _ in range(8)],
+            "ctR": [random.randint(0, 255) for _ in range(272)],
+            "parent": (i - 1) / 2 if i > 0 else None,
+            "left": 2*i + 1 if 2*i + 1 < nnodes else None,
+            "right": 2*i + 2 if 2*i + 2 < nnodes else None,
+            "iname": "age",
+            "height": 1
+        }
+    return tree
+
+tree = build_tree(NNODES)
+
+def walk_queue(tree):
+    queue = Queue()
+    queue.put(tree[0])
+    niterations = 0
+    while queue.qsize() > 0:
+        node = queue.get() # consume
+        while node is None and queue.qsize() > 0:
+            node = queue.get() # consume
+        if node is None:
+            break # End
+        if node["left"] is not None:
+            queue.put(tree[node["left"]])
+        if node["right"] is not None:
+            queue.put(tree[node["right"]])
+        niterations = niterations + 1
+    return niterations
+
+def walk_frontier(tree):
+    frontier = [tree[0]]
+    niterations = 0
+    while len(frontier) > 0:
+        next_level = []
+        for node in frontier:
+            next_level.extend([x for x in (node["left"], node["right"]) if x is not None])
+        niterations = niterations + len(frontier)
+        frontier = [tree[x] for x in next_level]
+    return niterations
+
+def test_walk_queue(benchmark):
+    benchmark.extra_info["nodes"] = NNODES
+    assert benchmark(walk_queue, tree) == NNODES
+
+def test_walk_frontier(benchmark):
+    benchmark.extra_info["nodes"] = NNODES
+    assert benchmark(walk_frontier, tree) == NNODES
+
+if __name__ == '__main__':
+    import time
+    for walk in (walk_queue, walk_frontier):
+        start = time.time()
+        n = walk(tree)
+        diff = time.time() - start
+        print "%s: %d nodes in %fs (%f us/node)" % (walk.__name__, n, diff, diff*10**6/n)
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+#
+# Storage and addition cost of Paillier counters, one per ciphertext or
+# packed in slots (see Paillier.encrypt_packed).
+#
+# Each counter holds a Netflix rating (1 to 5) and leaves room for
+# NADDITIONS additions. Ciphertexts are stored as decimal strings, as
+# Client does.
+#
+# py.test packing.py --benchmark-warmup=on --benchmark-disable-gc
+#
+import random
+import pytest
+from secmongo.crypto.paillier import Paillier
+
+NADDITIONS = 10**6
+NCOUNTERS = 1000
+
+keys = Paillier.keygen()
+paillier = Paillier(keys)
+n2 = keys["pub"]["n"]**2
+slot_bits = Paillier.slot_bits_for(5, NADDITIONS)
+nslots = paillier.slots(slot_bits)
+
+counters = [random.randint(1, 5) for _ in range(NCOUNTERS)]
+unpacked = [long(paillier.encrypt(x)) for x in counters]
+packed = [long(paillier.encrypt_packed(counters[i:i+nslots], slot_bits))
+          for i in range(0, NCOUNTERS, nslots)]
+
+def bytes_per_counter(cts):
+    return sum(len(str(x)) for x in cts) / float(NCOUNTERS)
+
+def add(a, b):
+    return [x*y % n2 for x, y in zip(a, b)]
+
+def test_add_unpacked(benchmark):
+    benchmark.extra_info["bytes_per_counter"] = bytes_per_counter(unpacked)
+    benchmark(add, unpacked, unpacked)
+
+def test_add_packed(benchmark):
+    benchmark.extra_info["bytes_per_counter"] = bytes_per_counter(packed)
+    benchmark.extra_info["slots"] = nslots
+    result = benchmark(add, packed, packed)
+    assert paillier.decrypt_packed(result[0], slot_bits, nslots) == [2*x for x in counters[:nslots]]
+
+if __name__ == '__main__':
+    import time
+    print "%d slots of %d bits per ciphertext" % (nslots, slot_bits)
+    for name, cts in (("unpacked", unpacked), ("packed", packed)):
+        start = time.time()
+        add(cts, cts)
+        diff = time.time() - start
+        print "%s: %.1f bytes per counter, %.0f counter adds/s" % (name, bytes_per_counter(cts), NCOUNTERS/diff)
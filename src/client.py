@@ -31,6 +31,7 @@ from secmongo.crypto import elgamal
 from secmongo.crypto.ore import ORE
 from datetime import timedelta
 from datetime import date
+from bson.binary import Binary
 import struct
 
 
@@ -51,8 +52,8 @@ def is_int(n):
         return False
 
 class Client:
-    __supported_attr_types = ["static", "index", "h_add", "h_mul",
-                              "do_nothing"]
+    __supported_attr_types = ["static", "index", "h_add", "h_add_packed",
+                              "h_mul", "do_nothing"]
     # 
     # A map of attributes that should be encrypted as a particular class
     # for instance, {static:[name, age, address, count], h_add:[count]} will
@@ -60,17 +61,23 @@ class Client:
     # count to be encrypted also as h_add
     # 
     __mapped_attr = {}
+    # Slot width of each h_add_packed attribute
+    __slot_bits = {}
 
     # Ciphers
     ciphers = {}
 
-    def __init__(self, keys):
+    #
+    # backend: big integer arithmetic of Paillier and ElGamal, "gmpy2" or
+    #          "python". gmpy2 is used if it is installed, by default.
+    #
+    def __init__(self, keys, backend = None):
         self.keys = keys
         # Initializes all ciphers
         AES = aes.AES()
         AES.add_to_private_key("key", keys["AES"])
 
-        Paillier = paillier.Paillier()
+        Paillier = paillier.Paillier(backend = backend)
         Paillier.add_to_private_key("lambda", 117668535328987834733689137263689797298977817639429644060749368527644686726669296731885251952344689212879739921514739655067928530440046015056096688399083645657472888121212951216520851399887876525989934400216686895826326664246358568791172640501226072668741206059249533639801502947840932944016267812429948585960L)
         Paillier.add_to_public_key("n", 117668535328987834733689137263689797298977817639429644060749368527644686726669296731885251952344689212879739921514739655067928530440046015056096688399083667529605534667335757959902320130332095941714707811038322265779765008946794346684879884355233783223579740293554891297286661970157653473900579699481419234807L)
         Paillier.add_to_public_key("g", 117668535328987834733689137263689797298977817639429644060749368527644686726669296731885251952344689212879739921514739655067928530440046015056096688399083667529605534667335757959902320130332095941714707811038322265779765008946794346684879884355233783223579740293554891297286661970157653473900579699481419234808L)
@@ -79,7 +86,7 @@ class Client:
         # Paillier.add_to_public_key("n", keys["Paillier"]["pub"]["n"])
         # Paillier.add_to_public_key("g", keys["Paillier"]["pub"]["g"])
 
-        ElGamal = elgamal.ElGamal()
+        ElGamal = elgamal.ElGamal(backend = backend)
         ElGamal.add_to_public_key("p", keys["ElGamal"]["pub"]["p"])
         ElGamal.add_to_public_key("alpha", keys["ElGamal"]["pub"]["alpha"])
         ElGamal.add_to_public_key("beta", keys["ElGamal"]["pub"]["beta"])
@@ -87,9 +94,7 @@ class Client:
 
         ore = ORE()
         # ore.keygen()
-        ore.sk = (10, ((3223259985674656667L, 2545841574562126603L), (6648204193183595420L, 947396505544782198L), (10262699335115293910L, 12481950425502523357L), (11157155043314648013L, 10949369431025463995L), (11449385253512302172L, 3737047598145425793L), (14849964137264564366L, 6477956134748224053L), (8516286119396656814L, 5040449266868623151L), (6519988066647821184L, 260632987663511989L), (8526636966755636671L, 3722214930938200720L), (9203381554123655654L, 8945572252108388435L), (17817520749984642683L, 14187317918651806955L), (1L, 4990873L), (0L, 139930034503680L), (0L, 0L), (0L, 139932614805264L), (139930034503690L, 4959270L)), 10, ((18339622188540201800L, 13460209471301406482L), (6609222744464408615L, 734129833637601795L), (4171575670374974697L, 9450853066432056315L), (3410519472982782108L, 2694487752145932959L), (14257035632522015546L, 5112437236391459009L), (940852219221491269L, 2912186625399794906L), (16928794174384356480L, 12401838118053217345L), (8907847841761730801L, 6049779216749759531L), (15853460724620576482L, 8079141652577108643L), (7840338763158696984L, 4556332979460618291L), (5870209929380976196L, 2407680133169321191L), (0L, 5105312L), (139932614810752L, 9838200L), (139932661444688L, 139932614810752L), (0L, 4918451L), (10L, 4863747L)))
-        ore.n = 32
-        ore.k = 8
+        ore.set_key((10, ((3223259985674656667L, 2545841574562126603L), (6648204193183595420L, 947396505544782198L), (10262699335115293910L, 12481950425502523357L), (11157155043314648013L, 10949369431025463995L), (11449385253512302172L, 3737047598145425793L), (14849964137264564366L, 6477956134748224053L), (8516286119396656814L, 5040449266868623151L), (6519988066647821184L, 260632987663511989L), (8526636966755636671L, 3722214930938200720L), (9203381554123655654L, 8945572252108388435L), (17817520749984642683L, 14187317918651806955L), (1L, 4990873L), (0L, 139930034503680L), (0L, 0L), (0L, 139932614805264L), (139930034503690L, 4959270L)), 10, ((18339622188540201800L, 13460209471301406482L), (6609222744464408615L, 734129833637601795L), (4171575670374974697L, 9450853066432056315L), (3410519472982782108L, 2694487752145932959L), (14257035632522015546L, 5112437236391459009L), (940852219221491269L, 2912186625399794906L), (16928794174384356480L, 12401838118053217345L), (8907847841761730801L, 6049779216749759531L), (15853460724620576482L, 8079141652577108643L), (7840338763158696984L, 4556332979460618291L), (5870209929380976196L, 2407680133169321191L), (0L, 5105312L), (139932614810752L, 9838200L), (139932661444688L, 139932614810752L), (0L, 4918451L), (10L, 4863747L))), 32, 8)
         print ore.sk
 
         Dummy = dummy_cipher.Cipher()
@@ -97,6 +102,7 @@ class Client:
         self.ciphers = {"static": AES,
                         "index": ore,
                         "h_add": Paillier,
+                        "h_add_packed": Paillier,
                         "h_mul": ElGamal,
                         "do_nothing": Dummy}
 
@@ -138,7 +144,20 @@ class Client:
                     cipher = self.ciphers[attribute_type]
                     if attribute in self.__mapped_attr[attribute_type]:
                         # Add the related ciphertext for attribute_type
+                        if attribute_type == "h_add_packed":
+                            # pt[attribute] is a list of counters
+                            result[attribute][attribute_type] = cipher.encrypt_packed( pt[attribute], self.__slot_bits[attribute])
+                            continue
+                        if attribute_type == "h_add":
+                            # From the stored g^m if pt[attribute] is in the
+                            # domain of attribute
+                            result[attribute][attribute_type] = cipher.encrypt( pt[attribute], domain = attribute)
+                            continue
                         result[attribute][attribute_type] = cipher.encrypt( pt[attribute])
+                        if attribute_type == "index":
+                            # ORE ciphertexts are bytes and are stored as
+                            # BSON BinData
+                            result[attribute][attribute_type] = [Binary(x) for x in result[attribute][attribute_type]]
         return result
 
     # Decrypts the return of a query
@@ -167,6 +186,10 @@ class Client:
                     cipher = self.ciphers[attribute_type]
                     if attribute in self.__mapped_attr[attribute_type]:
                         # Add the related ciphertext for attribute_type
+                        if attribute_type == "h_add_packed":
+                            # Every slot, including the unused ones
+                            result[attribute][attribute_type] = cipher.decrypt_packed( ct[attribute][attribute_type], self.__slot_bits[attribute])
+                            continue
                         result[attribute][attribute_type] = cipher.decrypt( ct[attribute][attribute_type])
                         if is_int(result[attribute][attribute_type]):
                             result[attribute][attribute_type] = int(result[attribute][attribute_type])
@@ -175,12 +198,12 @@ class Client:
     def get_ctL(self, target):
         # Returns the left side of the ciphertext
         cipher = self.ciphers["index"]
-        return cipher.encrypt(target)[0]
+        return cipher.encrypt_left(target)
 
     def get_ctR(self, target):
         # Returns the right side of the ciphertext
         cipher = self.ciphers["index"]
-        return cipher.encrypt(target)[1]
+        return cipher.encrypt_right(target)
 
     def get_supported_attr_types(self):
         return tuple(self.__supported_attr_types)
@@ -188,11 +211,27 @@ class Client:
     # 
     # Maps an attribute to one of those supported fields
     # 
-    def add_attr(self, name, attribute = "static"):
+    # domain: the values name may take. Only h_add attributes accept it. The
+    #         ciphertexts of those values are kept by the cipher under name,
+    #         see Paillier.add_domain. They are encrypted fastest once
+    #         ciphers["h_add"].start_pool() is called.
+    # slot_bits: width of each counter of an h_add_packed attribute, whose
+    #            values are lists of counters sharing a single ciphertext.
+    #            Paillier.SLOT_BITS by default.
+    # 
+    def add_attr(self, name, attribute = "static", domain = None, slot_bits = None):
         assert type(name) == str
         assert type(attribute) == str
         assert attribute in self.__supported_attr_types
 
+        if domain is not None:
+            assert attribute == "h_add"
+            self.ciphers[attribute].add_domain(name, domain)
+        if attribute == "h_add_packed":
+            self.__slot_bits[name] = paillier.Paillier.SLOT_BITS if slot_bits is None else slot_bits
+        else:
+            assert slot_bits is None
+
         if attribute not in self.__mapped_attr.keys():
             self.__mapped_attr[attribute] = [name]
         else:
@@ -24,7 +24,7 @@
 #include <stdint.h>
 
 // Helper macro for error handling
-static int _error_flag;
+static _Thread_local int _error_flag;
 #define ERR_CHECK(x) if((_error_flag = x) != ERROR_NONE) { return _error_flag; }
 
 int generate_prf_key(prf_key key) {
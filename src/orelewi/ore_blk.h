@@ -117,6 +117,25 @@ int ore_blk_cleanup(ore_blk_secret_key sk);
  */
 int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg);
 
+/**
+ * Computes only the left (or only the right) side of an encryption of a
+ * message. The other side of the ciphertext is left untouched.
+ *
+ * These functions are only provided by the left/right variant of the scheme
+ * (ore_blk_leftright.c), in which comparisons take the left ciphertext of one
+ * message and the right ciphertext of the other.
+ *
+ * @param ctxt The ciphertext to store the encryption (which must have been
+ *             initialized)
+ * @param sk   The secret key (which must have been initialized)
+ * @param msg  The input (represented as an unsigned 64-bit integer)
+ *
+ * @return ERROR_NONE on success, and a corresponding error code on failure
+ *         (see errors.h for the full list of possible error codes)
+ */
+int ore_blk_encrypt_ui_left(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg);
+int ore_blk_encrypt_ui_right(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg);
+
 /**
  * Performs the comparison of two ciphertexts to determine the ordering of their
  * underlying plaintexts.
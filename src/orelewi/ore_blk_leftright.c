@@ -23,7 +23,7 @@
 #include <string.h>
 
 // Helper macro for error handling
-static int _error_flag;
+static _Thread_local int _error_flag;
 #define ERR_CHECK(x) if((_error_flag = x) != ERROR_NONE) { return _error_flag; }
 
 // The ceiling function
@@ -65,11 +65,11 @@ static inline int _py_ore_blk_ciphertext_len_right(ore_blk_params params) {
 // encryption is derived from an internal PRG (implemented using AES in
 // counter mode). This is for demo purposes only. For concrete applications,
 // it may be preferable to use a different source for the encryption
-// randomness. Note that this implementation is NOT thread-safe, and is
-// intended primarily for demo purposes.
-static bool _prg_initialized = false;
-static uint64_t _counter = 0;
-static AES_KEY _prg_key;
+// randomness. The PRG state is thread-local: each thread seeds its own key
+// and counter the first time it encrypts, so encryptions may run in parallel.
+static _Thread_local bool _prg_initialized = false;
+static _Thread_local uint64_t _counter = 0;
+static _Thread_local AES_KEY _prg_key;
 
 // The maximum supported block length in bite (chosen primarily for efficiency
 // reasons).
@@ -109,9 +109,9 @@ static bool _is_valid_params(ore_blk_params params) {
 }
 
 /**
- * Seeds the internal PRG (used to derive the encryption randomness). The PRG
- * uses a AES in counter mode. To seed the PRG, a fresh AES key is sampled and
- * the counter is initialized to 0.
+ * Seeds the internal PRG (used to derive the encryption randomness) of the
+ * calling thread. The PRG uses a AES in counter mode. To seed the PRG, a fresh
+ * AES key is sampled and the counter is initialized to 0.
  */
 static void _seed_prg() {
   generate_aes_key(&_prg_key);
@@ -122,9 +122,8 @@ static void _seed_prg() {
 /**
  * Gets the next block (16 byts) of output from the PRG. The next block is
  * computed by invoking AES on the current value of the counter. The value of
- * the counter is updated afterwards. This PRG implementation is NOT thread-
- * safe, so this library should not be used as is in a multi-threaded
- * execution environment.
+ * the counter is updated afterwards. Both the key and the counter belong to
+ * the calling thread.
  *
  * @param out  Buffer that will hold the next block of the PRG
  *
@@ -244,7 +243,7 @@ int ore_blk_cleanup(ore_blk_secret_key sk) {
    *         (see errors.h for the full list of possible error codes)
    */
   static inline int _eval_keyed_hash_sha256(uint8_t* out, const block key, const block val) {
-    static byte inputbuf[AES_OUTPUT_BYTES + sizeof(block)];
+    byte inputbuf[AES_OUTPUT_BYTES + sizeof(block)];
     memcpy(inputbuf, &key, sizeof(block));
     memcpy(inputbuf + sizeof(block), &val, sizeof(block));
 
@@ -318,8 +317,10 @@ static inline int _eval_keyed_hash_batch(uint8_t* out, uint32_t nblocks,
   * a left ciphertext and a right ciphertext with the property that the right
   * ciphertext provides semantic security.
   *
-  * @param comp_left   A buffer to hold the left ciphertext component
-  * @param comp_right  A buffer to hold the right ciphertext component
+  * @param comp_left   A buffer to hold the left ciphertext component (or
+  *                    NULL to skip the left side)
+  * @param comp_right  A buffer to hold the right ciphertext component (or
+  *                    NULL to skip the right side)
   * @param sk          The secret key for the ORE scheme
   * @param nonce       The nonce used for encryption (should be unique for
   *                    each ciphertext)
@@ -345,15 +346,22 @@ static int _ore_blk_encrypt_block(byte* comp_left, byte* comp_right, ore_blk_sec
   AES_KEY prp_key;
   ERR_CHECK(setup_aes_key(&prp_key, (byte*) &prp_key_buf, sizeof(block)));
 
+  uint64_t prefix_shifted = prefix << block_len;
+
   // construct left ciphertext (PRP evaluation on the value)
-  uint64_t pix = 0;
-  ERR_CHECK(prp_eval((byte*) &pix, &prp_key, (byte*) &val, block_len));
+  if (comp_left != NULL) {
+    uint64_t pix = 0;
+    ERR_CHECK(prp_eval((byte*) &pix, &prp_key, (byte*) &val, block_len));
+
+    block key;
+    ERR_CHECK(aes_eval(&key, &sk->prf_key, MAKE_BLOCK(block_ind, prefix_shifted | pix)));
+    memcpy(comp_left, &key, sizeof(block));
+    memcpy(comp_left + sizeof(block), &pix, CEIL(block_len, 8));
+  }
 
-  block key;
-  uint64_t prefix_shifted = prefix << block_len;
-  ERR_CHECK(aes_eval(&key, &sk->prf_key, MAKE_BLOCK(block_ind, prefix_shifted | pix)));
-  memcpy(comp_left, &key, sizeof(block));
-  memcpy(comp_left + sizeof(block), &pix, CEIL(block_len, 8));
+  if (comp_right == NULL) {
+    return ERROR_NONE;
+  }
 
   // construct right ciphertext (encryption of comparison vector under keys
   // derived from PRF)
@@ -412,7 +420,21 @@ static int _ore_blk_encrypt_block(byte* comp_left, byte* comp_right, ore_blk_sec
   return ERROR_NONE;
 }
 
-int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg) {
+/**
+ * Encrypts a message, computing the left side, the right side or both sides
+ * of the ciphertext.
+ *
+ * @param ctxt  The ciphertext to store the encryption
+ * @param sk    The secret key
+ * @param msg   The input (represented as an unsigned 64-bit integer)
+ * @param left  Whether the left ciphertext should be computed
+ * @param right Whether the right ciphertext should be computed
+ *
+ * @return ERROR_NONE on success, and a corresponding error code on failure
+ *         (see errors.h for the full list of possible error codes)
+ */
+static int _ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg,
+                               bool left, bool right) {
   if (!sk->initialized) {
     return ERROR_SK_NOT_INITIALIZED;
   }
@@ -429,7 +451,7 @@ int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t
     return ERROR_PARAMS_INVALID;
   }
 
-  if (!_prg_initialized) {
+  if (right && !_prg_initialized) {
     _seed_prg();
   }
 
@@ -441,14 +463,22 @@ int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t
   uint32_t block_mask = (1 << block_len) - 1;
   block_mask <<= (block_len * (nblocks - 1));
 
-  // choose nonce
-  block nonce;
-  ERR_CHECK(_next_prg_block(&nonce));
-  memcpy(ctxt->comp_right, &nonce, sizeof(block));
+  // each left block leaves CEIL(nbits, 8) bytes for pix but only
+  // CEIL(block_len, 8) of them are written, so the rest must be zeroed
+  if (left) {
+    memset(ctxt->comp_left, 0, (AES_BLOCK_LEN + CEIL(nbits, 8)) * nblocks);
+  }
+
+  // choose nonce (only the right ciphertext uses it)
+  block nonce = MAKE_BLOCK(0, 0);
+  if (right) {
+    ERR_CHECK(_next_prg_block(&nonce));
+    memcpy(ctxt->comp_right, &nonce, sizeof(block));
+  }
 
   // set up left and right pointers for each block
-  byte* comp_left = ctxt->comp_left;
-  byte* comp_right = ctxt->comp_right + sizeof(block);
+  byte* comp_left = left ? ctxt->comp_left : NULL;
+  byte* comp_right = right ? ctxt->comp_right + sizeof(block) : NULL;
 
   uint32_t len_left_block  = AES_BLOCK_LEN + CEIL(nbits, 8);
   uint32_t len_right_block = 2*CEIL(nslots, 8);
@@ -467,13 +497,29 @@ int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t
     prefix |= cur_block;
 
     // update block pointers
-    comp_left  += len_left_block;
-    comp_right += len_right_block;
+    if (left) {
+      comp_left  += len_left_block;
+    }
+    if (right) {
+      comp_right += len_right_block;
+    }
   }
 
   return ERROR_NONE;
 }
 
+int ore_blk_encrypt_ui(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg) {
+  return _ore_blk_encrypt_ui(ctxt, sk, msg, true, true);
+}
+
+int ore_blk_encrypt_ui_left(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg) {
+  return _ore_blk_encrypt_ui(ctxt, sk, msg, true, false);
+}
+
+int ore_blk_encrypt_ui_right(ore_blk_ciphertext ctxt, ore_blk_secret_key sk, uint64_t msg) {
+  return _ore_blk_encrypt_ui(ctxt, sk, msg, false, true);
+}
+
 int ore_blk_compare(int* result_p, ore_blk_ciphertext ctxt1, ore_blk_ciphertext ctxt2) {
   if (!ctxt1->initialized || !ctxt2->initialized) {
     return ERROR_CTXT_NOT_INITIALIZED;
@@ -492,7 +538,10 @@ int ore_blk_compare(int* result_p, ore_blk_ciphertext ctxt1, ore_blk_ciphertext
   uint32_t nslots = 1 << block_len;
   uint32_t nblocks = CEIL(nbits, block_len);
 
-  block nonce = *(block*) ctxt2->comp_right;
+  // The right ciphertext may live in a Python buffer, which is not
+  // guaranteed to be 16-byte aligned
+  block nonce;
+  memcpy(&nonce, ctxt2->comp_right, sizeof(block));
 
   uint32_t offset_left = 0;
   uint32_t offset_right = sizeof(block);
@@ -502,21 +551,21 @@ int ore_blk_compare(int* result_p, ore_blk_ciphertext ctxt1, ore_blk_ciphertext
 
   uint64_t index = 0;
 
-  mpz_t ctxt_block;
-  mpz_init(ctxt_block);
-
   uint8_t r;
 
   block key_block;
   // compare each block
   for (int i = 0; i < nblocks; i++) {
     memcpy(&index, ctxt1->comp_left + offset_left + AES_KEY_BYTES, CEIL(block_len, 8));
-    mpz_import(ctxt_block, 2*CEIL(nslots, 8), 1, 1, 1, 0, ctxt2->comp_right + offset_right);
 
     memcpy(&key_block, ctxt1->comp_left + offset_left, sizeof(block));
     ERR_CHECK(_eval_keyed_hash(&r, key_block, nonce));
-    int8_t bit0 = mpz_tstbit(ctxt_block, index*2);
-    int8_t bit1 = mpz_tstbit(ctxt_block, index*2+1);
+
+    // The right block is big-endian and both bits of a slot share a byte
+    const byte* ctxt_block = ctxt2->comp_right + offset_right;
+    byte slot = ctxt_block[len_right_block - 1 - (index >> 2)] >> ((index & 3) * 2);
+    int8_t bit0 = slot & 1;
+    int8_t bit1 = (slot >> 1) & 1;
     int8_t v = bit0 + bit1*2 - r;
     assert(bit0 == 0 || bit1 == 0);
 
@@ -527,14 +576,10 @@ int ore_blk_compare(int* result_p, ore_blk_ciphertext ctxt1, ore_blk_ciphertext
     if( *result_p != 0)
       break;
 
-      offset_right += len_right_block;
-      offset_left  += len_left_block;
+    offset_right += len_right_block;
+    offset_left  += len_left_block;
   }
 
-
-  // *result_p = (v == 1) ? -1 : 1;
-  mpz_clear(ctxt_block);
-
   return ERROR_NONE;
 }
 
@@ -577,7 +622,7 @@ int init_ore_blk_ciphertext(ore_blk_ciphertext ctxt, ore_blk_params params) {
     return ERROR_NULL_POINTER;
   }
 
-  ctxt->comp_left = malloc(_ore_blk_ciphertext_len_left(params));
+  ctxt->comp_left = calloc(1, _ore_blk_ciphertext_len_left(params));
   if (ctxt->comp_left == NULL) {
     return ERROR_MEMORY_ALLOCATION;
   }
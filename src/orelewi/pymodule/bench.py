@@ -35,3 +35,34 @@ def test_parametrized(benchmark, foo):
     benchmark(time.sleep, 0.00001)
     if benchmark.enabled:
         assert benchmark.stats.stats.min >= 0.00001
+
+import random
+import LewiWuOREBlkLF as oreLF
+
+ORE_N = 32
+ORE_K = 8
+ORE_NCTXTS = 1024
+ore_sk = oreLF.keygen(ORE_N, ORE_K)
+ore_ctxts = [oreLF.encrypt(random.randint(0, 2**20), ore_sk, ORE_N, ORE_K)
+             for _ in range(ORE_NCTXTS)]
+
+
+def test_ore_compare(benchmark):
+    # One call per pair, as SecMongo.find used to do
+    pairs = [(ore_ctxts[0][0], ctR) for _, ctR in ore_ctxts]
+
+    def compare_all():
+        for ctL, ctR in pairs:
+            oreLF.compare(ORE_N, ORE_K, ctL, ctR)
+    benchmark(compare_all)
+    if benchmark.enabled:
+        benchmark.extra_info["compares/s"] = ORE_NCTXTS / benchmark.stats.stats.mean
+
+
+def test_ore_compare_many(benchmark):
+    ctL = ore_ctxts[0][0]
+    ctRs = [ctR for _, ctR in ore_ctxts]
+    result = benchmark(oreLF.compare_many, ORE_N, ORE_K, ctL, ctRs)
+    assert len(result) == ORE_NCTXTS
+    if benchmark.enabled:
+        benchmark.extra_info["compares/s"] = ORE_NCTXTS / benchmark.stats.stats.mean
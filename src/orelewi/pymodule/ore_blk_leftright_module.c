@@ -11,7 +11,7 @@
 #define CEIL(x, y) (((x) + (y) - 1) / (y))
 
 // Helper macro for error handling
-static int _error_flag;
+static _Thread_local int _error_flag;
 #define ERR_CHECK(x) if((_error_flag = x) != ERROR_NONE) { printf("Erro %d\n",_error_flag);exit(1); }
 
 /**
@@ -87,17 +87,6 @@ py_ore_blk_setup(PyObject *self, PyObject *args){
 
 }
 
-/* Converts a block/__m128i object to a array of uint64_t
- */
-PyObject *Py_byte_array_To_PyArray(byte* b, int length){
-  PyObject *pylist = PyTuple_New(length);
-
-  for(int i = 0; i < length; i++)
-    PyTuple_SetItem(pylist, i, PyInt_FromLong((long)b[i]));
-  
-  return pylist;
-}
-
 void Py_AESKEY_to_block_array(block* b, PyObject *obj, int length){
     // Set operands
   PyObject *iter = PyObject_GetIter(obj);
@@ -124,19 +113,9 @@ void Py_AESKEY_to_block_array(block* b, PyObject *obj, int length){
   return;
 }
 
-static PyObject *
-py_ore_blk_encrypt(PyObject *self, PyObject *args){
-  ore_blk_secret_key sk;
-  ore_blk_params params;
-  ore_blk_ciphertext ctx;
-  PyObject *tuplesk;
-  uint64_t msg;
-  params->initialized = true;
-
-  if (!PyArg_ParseTuple(args, "IOII", &msg, &tuplesk,&params->nbits,&params->block_len))
-    return NULL;
-
-  // Sk
+/* Rebuilds a secret key from the tuple returned by keygen.
+ */
+void Py_tuple_To_ore_blk_secret_key(ore_blk_secret_key sk, PyObject *tuplesk, ore_blk_params params){
   sk->initialized = true;
   sk->prf_key.rounds = (int)PyInt_AsLong(PyTuple_GetItem(tuplesk,0));
   Py_AESKEY_to_block_array(sk->prf_key.rd_key,PyTuple_GetItem(tuplesk,1),sk->prf_key.rounds);
@@ -145,16 +124,131 @@ py_ore_blk_encrypt(PyObject *self, PyObject *args){
   sk->params->initialized = true;
   sk->params->nbits = params->nbits;
   sk->params->block_len = params->block_len;
+}
+
+///////////////////
+// ORESecretKey  //
+///////////////////
+
+/* An opaque secret key. The AES key schedules are expanded once, when the
+ * object is built, and kept in native memory for all further encryptions.
+ */
+typedef struct {
+  PyObject_HEAD
+  ore_blk_secret_key *sk; // 16-byte aligned, as it holds __m128i round keys
+} ORESecretKeyObject;
+
+static void
+ORESecretKey_dealloc(ORESecretKeyObject *self){
+  if (self->sk != NULL) {
+    ore_blk_cleanup(*self->sk);
+    _mm_free(self->sk);
+  }
+  Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+static int
+ORESecretKey_init(ORESecretKeyObject *self, PyObject *args, PyObject *kwds){
+  PyObject *tuplesk;
+  ore_blk_params params;
+  params->initialized = true;
+
+  if (!PyArg_ParseTuple(args, "OII", &tuplesk, &params->nbits, &params->block_len))
+    return -1;
+  if (!PyTuple_Check(tuplesk) || PyTuple_Size(tuplesk) != 4) {
+    PyErr_SetString(PyExc_TypeError, "expected the secret key tuple returned by keygen");
+    return -1;
+  }
+
+  if (self->sk == NULL) {
+    self->sk = _mm_malloc(sizeof(ore_blk_secret_key), 16);
+    if (self->sk == NULL) {
+      PyErr_NoMemory();
+      return -1;
+    }
+  }
+  memset(self->sk, 0, sizeof(ore_blk_secret_key));
+  Py_tuple_To_ore_blk_secret_key(*self->sk, tuplesk, params);
+  if (PyErr_Occurred())
+    return -1;
+
+  return 0;
+}
+
+static PyTypeObject ORESecretKeyType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "LewiWuOREBlkLF.ORESecretKey",
+  .tp_basicsize = sizeof(ORESecretKeyObject),
+  .tp_dealloc = (destructor) ORESecretKey_dealloc,
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_doc = "ORESecretKey(sk, nbits, block_len)\n\n"
+            "A secret key kept in native memory. sk is the tuple returned by keygen.",
+  .tp_init = (initproc) ORESecretKey_init,
+  .tp_new = PyType_GenericNew,
+};
+
+/* Encrypts a message. Depending on left and right, returns a tuple
+ * (ctL, ctR) or only one of the sides.
+ */
+static PyObject *
+_py_ore_blk_encrypt(PyObject *args, bool left, bool right){
+  ore_blk_secret_key tmpsk;
+  ore_blk_secret_key *sk;
+  ore_blk_params params;
+  ore_blk_ciphertext ctx;
+  PyObject *pysk;
+  uint64_t msg = 0;
+  params->initialized = true;
+
+  if (!PyArg_ParseTuple(args, "IOII", &msg, &pysk,&params->nbits,&params->block_len))
+    return NULL;
+
+  // Sk
+  if (PyObject_TypeCheck(pysk, &ORESecretKeyType)) {
+    // Already expanded
+    sk = ((ORESecretKeyObject*) pysk)->sk;
+    if (sk == NULL) {
+      PyErr_SetString(PyExc_ValueError, "uninitialized ORESecretKey");
+      return NULL;
+    }
+    if ((*sk)->params->nbits != params->nbits || (*sk)->params->block_len != params->block_len) {
+      PyErr_SetString(PyExc_ValueError, "ORESecretKey was built for other parameters");
+      return NULL;
+    }
+  } else {
+    // Rebuilt from the tuple on every call
+    sk = &tmpsk;
+    Py_tuple_To_ore_blk_secret_key(*sk, pysk, params);
+  }
   // Ciphertext
   ERR_CHECK(init_ore_blk_ciphertext(ctx, params));
 
-  ERR_CHECK(ore_blk_encrypt_ui(ctx, sk, msg));
-
-  PyObject *ctxleft = Py_byte_array_To_PyArray(ctx->comp_left,_py_ore_blk_ciphertext_len_left(ctx->params));
-  PyObject *ctxright = Py_byte_array_To_PyArray(ctx->comp_right,_py_ore_blk_ciphertext_len_right(ctx->params));
+  // The PRG state is thread-local, so other threads may run meanwhile
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  if (left && right)
+    err = ore_blk_encrypt_ui(ctx, *sk, msg);
+  else if (left)
+    err = ore_blk_encrypt_ui_left(ctx, *sk, msg);
+  else
+    err = ore_blk_encrypt_ui_right(ctx, *sk, msg);
+  Py_END_ALLOW_THREADS
+  ERR_CHECK(err);
+
+  PyObject *ctxleft = NULL;
+  PyObject *ctxright = NULL;
+  if (left)
+    ctxleft = PyString_FromStringAndSize((char*)ctx->comp_left,_py_ore_blk_ciphertext_len_left(ctx->params));
+  if (right)
+    ctxright = PyString_FromStringAndSize((char*)ctx->comp_right,_py_ore_blk_ciphertext_len_right(ctx->params));
 
   ERR_CHECK(clear_ore_blk_ciphertext(ctx));
 
+  if (!left)
+    return ctxright;
+  if (!right)
+    return ctxleft;
+
   PyObject *return_value = Py_BuildValue("OO", ctxleft, ctxright);
 
   Py_DECREF(ctxleft);
@@ -162,6 +256,21 @@ py_ore_blk_encrypt(PyObject *self, PyObject *args){
   return return_value;
 }
 
+static PyObject *
+py_ore_blk_encrypt(PyObject *self, PyObject *args){
+  return _py_ore_blk_encrypt(args, true, true);
+}
+
+static PyObject *
+py_ore_blk_encrypt_left(PyObject *self, PyObject *args){
+  return _py_ore_blk_encrypt(args, true, false);
+}
+
+static PyObject *
+py_ore_blk_encrypt_right(PyObject *self, PyObject *args){
+  return _py_ore_blk_encrypt(args, false, true);
+}
+
 /* Converts a block/__m128i object to a array of uint64_t
  */
 void Py_To_PyArray_bytearray(byte *b, PyObject* obj){
@@ -190,6 +299,87 @@ void Py_To_PyArray_bytearray(byte *b, PyObject* obj){
   return;
 }
 
+/* A ciphertext component received from Python.
+ *
+ * Ciphertexts are bytes, but the legacy format (a sequence of small ints) is
+ * still accepted. When the object exposes the buffer protocol the component
+ * points straight at its memory and nothing is copied.
+ */
+typedef struct {
+  byte *data;
+  bool has_view;
+  Py_buffer view;
+} py_ore_blk_component;
+
+static int py_ore_blk_component_get(py_ore_blk_component *c, PyObject *obj, int length){
+  if (PyObject_CheckBuffer(obj)) {
+    if (PyObject_GetBuffer(obj, &c->view, PyBUF_SIMPLE) < 0)
+      return -1;
+    if (c->view.len < length) {
+      PyBuffer_Release(&c->view);
+      PyErr_Format(PyExc_ValueError, "expected a ciphertext of %d bytes", length);
+      return -1;
+    }
+    c->data = (byte*) c->view.buf;
+    c->has_view = true;
+  } else {
+    c->data = malloc(length);
+    if (c->data == NULL) {
+      PyErr_NoMemory();
+      return -1;
+    }
+    Py_To_PyArray_bytearray(c->data, obj);
+    c->has_view = false;
+  }
+  return 0;
+}
+
+static void py_ore_blk_component_release(py_ore_blk_component *c){
+  if (c->has_view)
+    PyBuffer_Release(&c->view);
+  else
+    free(c->data);
+  c->data = NULL;
+}
+
+/* Acquires one component from each element of a sequence. If item is not
+ * negative, each element is itself a sequence (e.g. a (ctL, ctR) pair) and
+ * its item-th entry is used. Returns NULL with an exception set on failure.
+ */
+static py_ore_blk_component *
+py_ore_blk_components_get(PyObject *seq, Py_ssize_t item, int length){
+  Py_ssize_t nctxs = PySequence_Fast_GET_SIZE(seq);
+  py_ore_blk_component *c = malloc(sizeof(py_ore_blk_component) * (nctxs + 1));
+  if (c == NULL)
+    return (py_ore_blk_component *) PyErr_NoMemory();
+
+  for(Py_ssize_t i = 0; i < nctxs; i++){
+    PyObject *obj = PySequence_Fast_GET_ITEM(seq, i);
+    int err;
+    if (item < 0) {
+      err = py_ore_blk_component_get(&c[i], obj, length);
+    } else {
+      obj = PySequence_GetItem(obj, item);
+      err = obj ? py_ore_blk_component_get(&c[i], obj, length) : -1;
+      // A view holds its own reference, so the item can be released here
+      Py_XDECREF(obj);
+    }
+    if (err < 0) {
+      while (i-- > 0)
+        py_ore_blk_component_release(&c[i]);
+      free(c);
+      return NULL;
+    }
+  }
+  return c;
+}
+
+static void py_ore_blk_components_release(py_ore_blk_component *c, Py_ssize_t nctxs){
+  for(Py_ssize_t i = 0; i < nctxs; i++)
+    py_ore_blk_component_release(&c[i]);
+  free(c);
+}
+
 static PyObject *
 py_ore_blk_compare(PyObject *self, PyObject *args){
   ore_blk_ciphertext ctx1;
@@ -203,33 +393,292 @@ py_ore_blk_compare(PyObject *self, PyObject *args){
                                       &ctx1left,
                                       &ctx2right))
     return NULL;
-    
-  ERR_CHECK(init_ore_blk_ciphertext(ctx1, params));
-  ERR_CHECK(init_ore_blk_ciphertext(ctx2, params));
-  
+
+  py_ore_blk_component left;
+  py_ore_blk_component right;
+  if (py_ore_blk_component_get(&left, ctx1left, _py_ore_blk_ciphertext_len_left(params)) < 0)
+    return NULL;
+  if (py_ore_blk_component_get(&right, ctx2right, _py_ore_blk_ciphertext_len_right(params)) < 0) {
+    py_ore_blk_component_release(&left);
+    return NULL;
+  }
+
   // Ciphertext1
   ctx1->initialized = true;
-  Py_To_PyArray_bytearray(ctx1->comp_left, ctx1left);
-  ctx1->params->initialized = true;
-  ctx1->params->nbits = params->nbits;
-  ctx1->params->block_len = params->block_len;
+  ctx1->comp_left = left.data;
+  memcpy(ctx1->params, params, sizeof(ore_blk_params));
 
   // // Ciphertext2
   ctx2->initialized = true;
-  Py_To_PyArray_bytearray(ctx2->comp_right, ctx2right);
-  ctx2->params->initialized = true;
-  ctx2->params->nbits = params->nbits;
-  ctx2->params->block_len = params->block_len;
+  ctx2->comp_right = right.data;
+  memcpy(ctx2->params, params, sizeof(ore_blk_params));
   
+  // The buffers are held by the views, so they stay valid without the GIL
   int res;
-  ERR_CHECK(ore_blk_compare(&res, ctx1, ctx2));
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = ore_blk_compare(&res, ctx1, ctx2);
+  Py_END_ALLOW_THREADS
+  ERR_CHECK(err);
 
-  ERR_CHECK(clear_ore_blk_ciphertext(ctx1));
-  ERR_CHECK(clear_ore_blk_ciphertext(ctx2));
+  py_ore_blk_component_release(&left);
+  py_ore_blk_component_release(&right);
 
   return Py_BuildValue("i", res);
 }
 
+/* Compares a single left ciphertext against a sequence of right ciphertexts.
+ * Returns a tuple with one comparison outcome (1, 0 or -1) for each right
+ * ciphertext.
+ */
+static PyObject *
+py_ore_blk_compare_many(PyObject *self, PyObject *args){
+  ore_blk_ciphertext ctx1;
+  ore_blk_ciphertext ctx2;
+  PyObject *ctx1left;
+  PyObject *ctx2rights;
+  ore_blk_params params;
+  params->initialized = true;
+  if (!PyArg_ParseTuple(args, "IIOO", &params->nbits,
+                                      &params->block_len,
+                                      &ctx1left,
+                                      &ctx2rights))
+    return NULL;
+
+  PyObject *seq = PySequence_Fast(ctx2rights, "expected a sequence of right ciphertexts");
+  if (!seq)
+    return NULL;
+  Py_ssize_t nctxs = PySequence_Fast_GET_SIZE(seq);
+
+  // Ciphertext1
+  // The left side is decoded only once and reused for all comparisons
+  py_ore_blk_component left;
+  if (py_ore_blk_component_get(&left, ctx1left, _py_ore_blk_ciphertext_len_left(params)) < 0) {
+    Py_DECREF(seq);
+    return NULL;
+  }
+  ctx1->initialized = true;
+  ctx1->comp_left = left.data;
+  memcpy(ctx1->params, params, sizeof(ore_blk_params));
+
+  ctx2->initialized = true;
+  memcpy(ctx2->params, params, sizeof(ore_blk_params));
+
+  // Ciphertext2
+  // All right sides are acquired first so the comparisons can run without
+  // the GIL
+  py_ore_blk_component *rights = py_ore_blk_components_get(seq, -1, _py_ore_blk_ciphertext_len_right(params));
+  int *res = malloc(sizeof(int) * (nctxs + 1));
+  if (rights == NULL || res == NULL) {
+    if (rights != NULL)
+      py_ore_blk_components_release(rights, nctxs);
+    free(res);
+    py_ore_blk_component_release(&left);
+    Py_DECREF(seq);
+    return res == NULL ? PyErr_NoMemory() : NULL;
+  }
+
+  int err = ERROR_NONE;
+  Py_BEGIN_ALLOW_THREADS
+  for(Py_ssize_t i = 0; i < nctxs && err == ERROR_NONE; i++){
+    ctx2->comp_right = rights[i].data;
+    err = ore_blk_compare(&res[i], ctx1, ctx2);
+  }
+  Py_END_ALLOW_THREADS
+  ERR_CHECK(err);
+
+  PyObject *result = PyTuple_New(nctxs);
+  for(Py_ssize_t i = 0; i < nctxs; i++)
+    PyTuple_SET_ITEM(result, i, PyInt_FromLong((long)res[i]));
+
+  py_ore_blk_components_release(rights, nctxs);
+  free(res);
+  py_ore_blk_component_release(&left);
+  Py_DECREF(seq);
+
+  return result;
+}
+
+/* Stable merge sort of the indexes in idx by the values they encrypt. The
+ * i-th value is given by lefts[i] and rights[i].
+ */
+static int _ore_blk_merge_sort(Py_ssize_t *idx, Py_ssize_t *tmp, Py_ssize_t n,
+                               py_ore_blk_component *lefts,
+                               py_ore_blk_component *rights,
+                               ore_blk_ciphertext ctx1, ore_blk_ciphertext ctx2){
+  if (n < 2)
+    return ERROR_NONE;
+
+  Py_ssize_t half = n / 2;
+  int err;
+  if ((err = _ore_blk_merge_sort(idx, tmp, half, lefts, rights, ctx1, ctx2)) != ERROR_NONE)
+    return err;
+  if ((err = _ore_blk_merge_sort(idx + half, tmp, n - half, lefts, rights, ctx1, ctx2)) != ERROR_NONE)
+    return err;
+
+  Py_ssize_t i = 0, j = half, k = 0;
+  while (i < half && j < n) {
+    // Take from the right run only if it is strictly smaller
+    int res;
+    ctx1->comp_left = lefts[idx[j]].data;
+    ctx2->comp_right = rights[idx[i]].data;
+    if ((err = ore_blk_compare(&res, ctx1, ctx2)) != ERROR_NONE)
+      return err;
+    tmp[k++] = (res == -1) ? idx[j++] : idx[i++];
+  }
+  while (i < half)
+    tmp[k++] = idx[i++];
+  while (j < n)
+    tmp[k++] = idx[j++];
+  memcpy(idx, tmp, sizeof(Py_ssize_t) * n);
+
+  return ERROR_NONE;
+}
+
+/* Sorts a sequence of (ctL, ctR) pairs by the values they encrypt. Returns
+ * a tuple with the indexes of the pairs in ascending order. The sort is
+ * stable.
+ */
+static PyObject *
+py_ore_blk_argsort(PyObject *self, PyObject *args){
+  ore_blk_ciphertext ctx1;
+  ore_blk_ciphertext ctx2;
+  PyObject *ctxs;
+  ore_blk_params params;
+  params->initialized = true;
+  if (!PyArg_ParseTuple(args, "IIO", &params->nbits,
+                                     &params->block_len,
+                                     &ctxs))
+    return NULL;
+
+  PyObject *seq = PySequence_Fast(ctxs, "expected a sequence of (ctL, ctR) pairs");
+  if (!seq)
+    return NULL;
+  Py_ssize_t nctxs = PySequence_Fast_GET_SIZE(seq);
+
+  py_ore_blk_component *lefts = py_ore_blk_components_get(seq, 0, _py_ore_blk_ciphertext_len_left(params));
+  if (lefts == NULL) {
+    Py_DECREF(seq);
+    return NULL;
+  }
+  py_ore_blk_component *rights = py_ore_blk_components_get(seq, 1, _py_ore_blk_ciphertext_len_right(params));
+  if (rights == NULL) {
+    py_ore_blk_components_release(lefts, nctxs);
+    Py_DECREF(seq);
+    return NULL;
+  }
+
+  Py_ssize_t *idx = malloc(sizeof(Py_ssize_t) * (nctxs + 1));
+  Py_ssize_t *tmp = malloc(sizeof(Py_ssize_t) * (nctxs + 1));
+  if (idx == NULL || tmp == NULL) {
+    free(idx);
+    free(tmp);
+    py_ore_blk_components_release(lefts, nctxs);
+    py_ore_blk_components_release(rights, nctxs);
+    Py_DECREF(seq);
+    return PyErr_NoMemory();
+  }
+  for(Py_ssize_t i = 0; i < nctxs; i++)
+    idx[i] = i;
+
+  ctx1->initialized = true;
+  memcpy(ctx1->params, params, sizeof(ore_blk_params));
+  ctx2->initialized = true;
+  memcpy(ctx2->params, params, sizeof(ore_blk_params));
+
+  int err;
+  Py_BEGIN_ALLOW_THREADS
+  err = _ore_blk_merge_sort(idx, tmp, nctxs, lefts, rights, ctx1, ctx2);
+  Py_END_ALLOW_THREADS
+  ERR_CHECK(err);
+
+  PyObject *result = PyTuple_New(nctxs);
+  for(Py_ssize_t i = 0; i < nctxs; i++)
+    PyTuple_SET_ITEM(result, i, PyInt_FromSsize_t(idx[i]));
+
+  free(idx);
+  free(tmp);
+  py_ore_blk_components_release(lefts, nctxs);
+  py_ore_blk_components_release(rights, nctxs);
+  Py_DECREF(seq);
+
+  return result;
+}
+
+/* Binary search of a left ciphertext in a sequence of right ciphertexts
+ * sorted in ascending order. If upper is false, returns the first position
+ * whose value is not less than the searched one. Otherwise, returns the
+ * first position whose value is greater than it.
+ */
+static PyObject *
+_py_ore_blk_bound(PyObject *args, bool upper){
+  ore_blk_ciphertext ctx1;
+  ore_blk_ciphertext ctx2;
+  PyObject *ctx1left;
+  PyObject *ctx2rights;
+  ore_blk_params params;
+  params->initialized = true;
+  if (!PyArg_ParseTuple(args, "IIOO", &params->nbits,
+                                      &params->block_len,
+                                      &ctx1left,
+                                      &ctx2rights))
+    return NULL;
+
+  PyObject *seq = PySequence_Fast(ctx2rights, "expected a sequence of right ciphertexts");
+  if (!seq)
+    return NULL;
+
+  py_ore_blk_component left;
+  if (py_ore_blk_component_get(&left, ctx1left, _py_ore_blk_ciphertext_len_left(params)) < 0) {
+    Py_DECREF(seq);
+    return NULL;
+  }
+  ctx1->initialized = true;
+  ctx1->comp_left = left.data;
+  memcpy(ctx1->params, params, sizeof(ore_blk_params));
+
+  ctx2->initialized = true;
+  memcpy(ctx2->params, params, sizeof(ore_blk_params));
+
+  // Only the probed right ciphertexts are ever decoded
+  Py_ssize_t lo = 0;
+  Py_ssize_t hi = PySequence_Fast_GET_SIZE(seq);
+  while (lo < hi) {
+    Py_ssize_t mid = lo + (hi - lo) / 2;
+    py_ore_blk_component right;
+    if (py_ore_blk_component_get(&right, PySequence_Fast_GET_ITEM(seq, mid), _py_ore_blk_ciphertext_len_right(params)) < 0) {
+      py_ore_blk_component_release(&left);
+      Py_DECREF(seq);
+      return NULL;
+    }
+    ctx2->comp_right = right.data;
+
+    int res;
+    ERR_CHECK(ore_blk_compare(&res, ctx1, ctx2));
+    py_ore_blk_component_release(&right);
+
+    if (res == 1 || (upper && res == 0))
+      lo = mid + 1;
+    else
+      hi = mid;
+  }
+
+  py_ore_blk_component_release(&left);
+  Py_DECREF(seq);
+
+  return PyInt_FromSsize_t(lo);
+}
+
+static PyObject *
+py_ore_blk_lower_bound(PyObject *self, PyObject *args){
+  return _py_ore_blk_bound(args, false);
+}
+
+static PyObject *
+py_ore_blk_upper_bound(PyObject *self, PyObject *args){
+  return _py_ore_blk_bound(args, true);
+}
+
 //////////////////
 // Python Setup //
 //////////////////
@@ -239,13 +688,33 @@ static PyMethodDef OREBLKMethods[] = {
      "Generates the master private key."},
     {"encrypt",  py_ore_blk_encrypt, METH_VARARGS,
      "Encrypts a message."},
+    {"encrypt_left",  py_ore_blk_encrypt_left, METH_VARARGS,
+     "Computes only the left ciphertext of a message."},
+    {"encrypt_right",  py_ore_blk_encrypt_right, METH_VARARGS,
+     "Computes only the right ciphertext of a message."},
     {"compare",  py_ore_blk_compare, METH_VARARGS,
      "Compares two ciphertexts."},
+    {"compare_many",  py_ore_blk_compare_many, METH_VARARGS,
+     "Compares a left ciphertext against a sequence of right ciphertexts."},
+    {"argsort",  py_ore_blk_argsort, METH_VARARGS,
+     "Returns the indexes that sort a sequence of (ctL, ctR) pairs."},
+    {"lower_bound",  py_ore_blk_lower_bound, METH_VARARGS,
+     "Finds the first sorted right ciphertext not less than a left ciphertext."},
+    {"upper_bound",  py_ore_blk_upper_bound, METH_VARARGS,
+     "Finds the first sorted right ciphertext greater than a left ciphertext."},
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
 PyMODINIT_FUNC
 initLewiWuOREBlkLF(void)
 { 
-  (void) Py_InitModule("LewiWuOREBlkLF", OREBLKMethods);
+  if (PyType_Ready(&ORESecretKeyType) < 0)
+    return;
+
+  PyObject *m = Py_InitModule("LewiWuOREBlkLF", OREBLKMethods);
+  if (m == NULL)
+    return;
+
+  Py_INCREF(&ORESecretKeyType);
+  PyModule_AddObject(m, "ORESecretKey", (PyObject *)&ORESecretKeyType);
 }
@@ -2,6 +2,7 @@
 import LewiWuOREBlk as ore
 import LewiWuOREBlkLF as oreLF
 from random import randint
+from multiprocessing.pool import ThreadPool
 import unittest
 import sys
 from math import log
@@ -47,6 +48,96 @@ class TestOREBlkLF(unittest.TestCase):
 				print "Fail! - pt1:\t%d,\tpt2:\t%d\texpected\t%d,\treceived %d\tdiff:\t%d\tdiffbits:\t%d" % (pt1,pt2,r_expected,r,pt1-pt2,log(pt1,2))
 				self.assertEqual(r, r_expected)
 
+class TestOREBlkLFBatch(unittest.TestCase):
+	N = 100
+	def setUp(self):
+		self.n = 32 # 
+		self.k = 8 # 
+		self.sk = oreLF.keygen(self.n,self.k)
+
+	def test_compare_many_lf(self):
+		pt1 = randint(0,pow(2,self.n)-1)
+		pts = [randint(0,pow(2,self.n)-1) for _ in range(self.N)] + [pt1]
+		ct1 = oreLF.encrypt(pt1,self.sk,self.n,self.k)
+		cts = [oreLF.encrypt(pt,self.sk,self.n,self.k)[1] for pt in pts]
+
+		r = oreLF.compare_many(self.n,self.k,ct1[0],cts)
+		r_expected = tuple([(1 if pt1 > pt2 else (-1 if pt1 < pt2 else 0)) for pt2 in pts])
+		self.assertEqual(r, r_expected)
+
+	def test_argsort_lf(self):
+		# A small domain, so that there are repeated values
+		pts = [randint(0,self.N/4) for _ in range(self.N)]
+		cts = [oreLF.encrypt(pt,self.sk,self.n,self.k) for pt in pts]
+
+		order = oreLF.argsort(self.n,self.k,cts)
+		self.assertEqual(list(order), sorted(range(self.N), key=lambda i: pts[i]))
+
+	def test_bounds_lf(self):
+		pts = sorted([randint(0,self.N/4) for _ in range(self.N)])
+		ctRs = [oreLF.encrypt_right(pt,self.sk,self.n,self.k) for pt in pts]
+
+		for pt in range(self.N/4 + 2):
+			ctL = oreLF.encrypt_left(pt,self.sk,self.n,self.k)
+			self.assertEqual(oreLF.lower_bound(self.n,self.k,ctL,ctRs), len([x for x in pts if x < pt]))
+			self.assertEqual(oreLF.upper_bound(self.n,self.k,ctL,ctRs), len([x for x in pts if x <= pt]))
+
+	def test_encrypt_left_right_lf(self):
+		for _ in range(self.N):
+			pt1 = randint(0,pow(2,self.n)-1)
+			pt2 = randint(0,pow(2,self.n)-1)
+			ctL = oreLF.encrypt_left(pt1,self.sk,self.n,self.k)
+			ctR = oreLF.encrypt_right(pt2,self.sk,self.n,self.k)
+
+			# The left side is deterministic
+			self.assertEqual(ctL, oreLF.encrypt(pt1,self.sk,self.n,self.k)[0])
+			r = oreLF.compare(self.n,self.k,ctL,ctR)
+			r_expected = (1 if pt1 > pt2 else (-1 if pt1 < pt2 else 0))
+			self.assertEqual(r, r_expected)
+
+	def test_left_deterministic_lf(self):
+		for _ in range(self.N):
+			pt = randint(0,pow(2,self.n)-1)
+			ct1 = oreLF.encrypt(pt,self.sk,self.n,self.k)
+			ct2 = oreLF.encrypt(pt,self.sk,self.n,self.k)
+
+			# Equal plaintexts must give byte-identical left ciphertexts
+			self.assertEqual(ct1[0], ct2[0])
+			self.assertEqual(oreLF.encrypt_left(pt,self.sk,self.n,self.k), oreLF.encrypt_left(pt,self.sk,self.n,self.k))
+			self.assertNotEqual(ct1[1], ct2[1])
+
+	def test_secret_key_object_lf(self):
+		key = oreLF.ORESecretKey(self.sk,self.n,self.k)
+		for _ in range(self.N):
+			pt1 = randint(0,pow(2,self.n)-1)
+			pt2 = randint(0,pow(2,self.n)-1)
+			ct1 = oreLF.encrypt(pt1,key,self.n,self.k)
+			ct2 = oreLF.encrypt(pt2,self.sk,self.n,self.k)
+
+			# Both keys must produce the same left ciphertexts
+			self.assertEqual(ct1[0], oreLF.encrypt_left(pt1,self.sk,self.n,self.k))
+			self.assertEqual(ct2[0], oreLF.encrypt_left(pt2,key,self.n,self.k))
+			r_expected = (1 if pt1 > pt2 else (-1 if pt1 < pt2 else 0))
+			self.assertEqual(oreLF.compare(self.n,self.k,ct1[0],ct2[1]), r_expected)
+			ctR = oreLF.encrypt_right(pt2,key,self.n,self.k)
+			self.assertEqual(oreLF.compare(self.n,self.k,ct1[0],ctR), r_expected)
+		self.assertRaises(ValueError, oreLF.encrypt, 1, key, self.n, 4)
+
+	def test_threaded_lf(self):
+		pts = [randint(0,pow(2,self.n)-1) for _ in range(self.N)]
+		pool = ThreadPool(4)
+		cts = pool.map(lambda pt: oreLF.encrypt(pt,self.sk,self.n,self.k), pts)
+		ctRs = [ct[1] for ct in cts]
+		r = pool.map(lambda ct: oreLF.compare_many(self.n,self.k,ct[0],ctRs), cts)
+		pool.close()
+		pool.join()
+
+		# Each thread has its own PRG, so nonces must not repeat
+		self.assertEqual(len(set([ctR[:16] for ctR in ctRs])), len(ctRs))
+		for pt1, r1 in zip(pts, r):
+			r_expected = tuple([(1 if pt1 > pt2 else (-1 if pt1 < pt2 else 0)) for pt2 in pts])
+			self.assertEqual(r1, r_expected)
+
 if __name__ == '__main__':
 	# if len(sys.argv) > 1:
 		# TestOREBlk.N = (int)(sys.argv.pop())
@@ -0,0 +1,87 @@
+/**
+ * Copyright (c) 2016, David J. Wu, Kevin Lewi
+ *
+ * Permission to use, copy, modify, and/or distribute this software for any
+ * purpose with or without fee is hereby granted, provided that the above
+ * copyright notice and this permission notice appear in all copies.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+ * REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+ * FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+ * INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+ * LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+ * OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+
+#include "errors.h"
+#include "ore_blk.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+static int _err;
+#define ERR_CHECK(x) if((_err = x) != ERROR_NONE) { return _err; }
+
+/**
+ * Benchmarking code for the left/right ORE scheme used by the Python module.
+ * Measures compares per second over a pool of random ciphertexts, so that
+ * every comparison walks a different number of blocks, as in an index
+ * traversal.
+ */
+int main(int argc, char** argv) {
+  const uint32_t NBITS[]     = {16, 32, 32, 64};
+  const uint32_t BLOCK_LEN[] = { 8,  4,  8,  8};
+  const uint32_t NCTXTS = 256;
+
+  uint32_t nparams = sizeof(NBITS) / sizeof(uint32_t);
+
+  printf("n = bit length of plaintext space\n");
+  printf("k = block size (in bits)\n\n");
+  printf("%2s %2s %12s %15s %15s %15s\n",
+         "n", "k", "iter", "cmp avg (us)", "cmp total (s)", "cmp/s");
+
+  for (int i = 0; i < nparams; i++) {
+    ore_blk_params params;
+    ERR_CHECK(init_ore_blk_params(params, NBITS[i], BLOCK_LEN[i]));
+
+    ore_blk_secret_key sk;
+    ERR_CHECK(ore_blk_setup(sk, params));
+
+    ore_blk_ciphertext* ctxts = malloc(sizeof(ore_blk_ciphertext) * NCTXTS);
+    for (int j = 0; j < NCTXTS; j++) {
+      ERR_CHECK(init_ore_blk_ciphertext(ctxts[j], params));
+      ERR_CHECK(ore_blk_encrypt_ui(ctxts[j], sk, rand() % 1024));
+    }
+
+    int res;
+    volatile int sink = 0;
+
+    uint64_t cmp_trials = 0;
+    clock_t start_time = clock();
+    while(clock() - start_time < CLOCKS_PER_SEC) {
+      for (int j = 0; j < NCTXTS; j++) {
+        for (int k = 0; k < NCTXTS; k++) {
+          ERR_CHECK(ore_blk_compare(&res, ctxts[j], ctxts[k]));
+          sink += res;
+        }
+      }
+      cmp_trials += NCTXTS * NCTXTS;
+    }
+    double cmp_time_elapsed = (double)(clock() - start_time) / CLOCKS_PER_SEC;
+    double cmp_time = cmp_time_elapsed / cmp_trials * 1000000;
+
+    printf("%2d %2d %12lu %15.3f %15.2f %15.0f\n",
+           NBITS[i], BLOCK_LEN[i], (unsigned long) cmp_trials, cmp_time,
+           cmp_time_elapsed, cmp_trials / cmp_time_elapsed);
+
+    for (int j = 0; j < NCTXTS; j++) {
+      ERR_CHECK(clear_ore_blk_ciphertext(ctxts[j]));
+    }
+    free(ctxts);
+    ERR_CHECK(ore_blk_cleanup(sk));
+  }
+
+  return 0;
+}
@@ -0,0 +1,106 @@
+##########################################################################
+##########################################################################
+#
+# mongodb-secure
+# Copyright (C) 2017, Pedro Alves and Diego Aranha
+# {pedro.alves, dfaranha}@ic.unicamp.br
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+##########################################################################
+#
+# About this module:
+#
+# - Backends for the big integer arithmetic of Paillier, ElGamal and
+#   generate_prime. Each one provides mpz, powmod, invert and gcd.
+# - gmpy2 is used if it is installed. Otherwise, the arithmetic falls back
+#   to Python longs.
+# - Numbers returned by a backend may be mpz. The ciphers convert them to
+#   long before handing them to their callers.
+#
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class PythonBackend:
+    name = "python"
+
+    @staticmethod
+    def mpz(x):
+        return long(x)
+
+    @staticmethod
+    def powmod(a, e, m):
+        if e < 0:
+            return pow(PythonBackend.invert(a, m), -e, m)
+        return pow(a, e, m)
+
+    @staticmethod
+    def invert(a, m):
+        # Extended Euclidean algorithm
+        x, u = 0, 1
+        b, c = m, a % m
+        while c != 0:
+            q, r = b//c, b%c
+            x, u = u, x-u*q
+            b, c = c, r
+        if b != 1:
+            raise ZeroDivisionError("%d is not invertible modulo %d" % (a, m))
+        return x % m
+
+    @staticmethod
+    def gcd(a, b):
+        while b != 0:
+            a, b = b, a % b
+        return abs(a)
+
+
+class GMPBackend:
+    name = "gmpy2"
+
+    @staticmethod
+    def mpz(x):
+        return gmpy2.mpz(x)
+
+    @staticmethod
+    def powmod(a, e, m):
+        return gmpy2.powmod(a, e, m)
+
+    @staticmethod
+    def invert(a, m):
+        return gmpy2.invert(a, m)
+
+    @staticmethod
+    def gcd(a, b):
+        return gmpy2.gcd(a, b)
+
+
+BACKENDS = {"python": PythonBackend}
+if gmpy2 is not None:
+    BACKENDS["gmpy2"] = GMPBackend
+
+#
+# Returns the backend called name ("gmpy2" or "python"). If name is None,
+# the fastest one available. A backend passed as name is returned as is.
+#
+def get_backend(name = None):
+    if name is None:
+        return GMPBackend if gmpy2 is not None else PythonBackend
+    if name in BACKENDS.values():
+        return name
+    if name not in BACKENDS:
+        raise ValueError("Unknown or unavailable arithmetic backend: %s" % name)
+    return BACKENDS[name]
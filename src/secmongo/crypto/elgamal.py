@@ -29,31 +29,39 @@ import os
 import generate_prime as Prime
 from Crypto.Random import random
 from .cipher import Cipher
+from . import arithmetic
 
 
 class ElGamal(Cipher):
+    # Arithmetic backend (see arithmetic.py)
+    backend = arithmetic.get_backend()
 
-    def __init__(self, keys=None, exponential_mode=False):
+    #
+    # backend: "gmpy2" or "python". The fastest one available, by default.
+    #
+    def __init__(self, keys=None, exponential_mode=False, backend=None):
         self.exponential_mode = exponential_mode
+        self.backend = arithmetic.get_backend(backend)
         Cipher.__init__(self,keys)
     
     @staticmethod
-    def keygen(key_size=1024):
+    def keygen(key_size=1024, backend=None):
         #
         # Public key: (p,alpha,beta)
         # Private key: (d) 
         #
+        backend = arithmetic.get_backend(backend)
         p = None
         while p is None:
             try:
-                p = Prime.generate_large_prime(key_size)
+                p = Prime.generate_large_prime(key_size, backend)
             except Exception,err:
                 print(err)
 
 
         alpha = random.randrange(1,p) # if |G| is prime, then all elements a not 1 \in G are primitives
         d = random.randrange(2,p-1)# from 2 to p-2
-        beta = pow(alpha,d,p)
+        beta = long(backend.powmod(alpha,d,p))
 
         keys = {"pub":{
                     "p":p,
@@ -69,7 +77,7 @@ class ElGamal(Cipher):
         if km is None:
             pub = Cipher.get_public_key(self)
             i = random.randrange(2,pub["p"]-1)
-            km = pow(pub["beta"],i,pub["p"])
+            km = long(self.backend.powmod(pub["beta"],i,pub["p"]))
         Cipher.add_to_public_key(self,"km",km)
         return km
         
@@ -94,24 +102,23 @@ class ElGamal(Cipher):
         beta = pub["beta"]
         km = pub["km"] if pub.has_key("km") else None
 
+        powmod = self.backend.powmod
         if self.exponential_mode:
-            if m < 0:
-                x = self.__modinv(pow(alpha,-m,p),p)
-            else:
-                x = pow(alpha,m,p)
+            # A negative exponent is taken as the inverse
+            x = powmod(alpha,m,p)
         else:
             x = m
 
         if not km:
             i = random.randrange(2,p-1)
-            ke = pow(alpha,i,p)
-            km = pow(beta,i,p)
+            ke = powmod(alpha,i,p)
+            km = powmod(beta,i,p)
 
             c = (x*km) % p
-            return c,ke
+            return long(c),long(ke)
         else:
             c = (x*km) % p
-            return c
+            return long(c)
 
     def decrypt(self,x):
         #
@@ -130,11 +137,11 @@ class ElGamal(Cipher):
             ke = x[1]
         else:
             c = x
-        km = pub["km"] if pub.has_key("km") else pow(ke,d,p)
+        km = pub["km"] if pub.has_key("km") else self.backend.powmod(ke,d,p)
 
-        inv = self.__modinv(km,p)
+        inv = self.backend.invert(km,p)
 
-        return c*inv % p
+        return long(c*inv % p)
 
     def generate_lookup_table(self,a=0,b=10**3):
         #
@@ -149,17 +156,9 @@ class ElGamal(Cipher):
 
         table = {}
         for i in xrange(a,b):
-            c = pow(alpha,i,p)
+            c = long(self.backend.powmod(alpha,i,p))
             table[c] = i
         return table
 
     def h_operation(self,a,b):
-        return a + b
-
-    def __modinv(self,x,p):
-        #
-        # Computes the moduler inversion of x ** p-2 mod p,
-        # for p prime
-        #
-        #return pow(x,p-2,p)
-        return pow(x,p-2,p)
\ No newline at end of file
+        return a + b
\ No newline at end of file
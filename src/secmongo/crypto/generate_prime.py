@@ -22,9 +22,10 @@
 import random
 import math
 import sys
+from . import arithmetic
 
 
-def miller_rabin(p, s=11):
+def miller_rabin(p, s=11, backend=None):
     # using security parameter s=11, we have a error probability of less than
     # 2**-80
 
@@ -35,15 +36,17 @@ def miller_rabin(p, s=11):
         u += 1
         r = r/2
 
+    powmod = arithmetic.get_backend(backend).powmod
+
     # apply miller_rabin primality test
     for i in range(s):
         a = random.randrange(2,p-1) # choose random a in {2,3,...,p-2}
-        z = pow(a,r,p)
+        z = powmod(a,r,p)
 
         if z != 1 and z != p-1:
             for j in range(u-1):
                 if z != p-1:
-                    z = pow(z,2,p)
+                    z = powmod(z,2,p)
                     if z == 1:
                         return False
                 else:
@@ -53,7 +56,7 @@ def miller_rabin(p, s=11):
     return True
 
 
-def is_prime(n):
+def is_prime(n, backend=None):
      #lowPrimes is all primes (sans 2, which is covered by the bitwise and operator)
      #under 1000. taking n modulo each lowPrime allows us to remove a huge chunk
      #of composite numbers from our potential pool without resorting to Rabin-Miller
@@ -74,12 +77,15 @@ def is_prime(n):
                     return True
                  if (n % p == 0):
                      return False
-             return miller_rabin(n)
+             return miller_rabin(n, backend=backend)
      elif n == 2:
          return True
      return False
 
-def generate_large_prime(k):
+#
+# backend: the arithmetic backend of the primality test (see arithmetic.py)
+#
+def generate_large_prime(k, backend=None):
     #print "Generating prime of %d bits" % k
     #k is the desired bit length
     r=100*(math.log(k,2)+1) #number of attempts max
@@ -88,6 +94,6 @@ def generate_large_prime(k):
         #unusable for serious crypto purposes
         n = random.randrange(2**(k-1),2**(k))
         r-=1
-        if is_prime(n) == True:
+        if is_prime(n, backend) == True:
             return n
     raise Exception("Failure after %d tries." % r)
@@ -4,6 +4,8 @@ import random
 class ORE():
     n = None  # Bit length of plaintext space
     k = None  # Block size (in bits)
+    sk = None  # The exportable secret key (a tuple)
+    key = None  # The secret key expanded in native memory
 
     def __init__(self):
         pass
@@ -11,21 +13,74 @@ class ORE():
     # message space size N > 0
     # d-ary strings x = x_1x_2x_3...x_n
     def keygen(self, n=32, k=8):
+        return self.set_key(ore.keygen(n, k), n, k)
+
+    # Loads a secret key exported by keygen. The AES key schedules are
+    # expanded only once.
+    def set_key(self, sk, n=32, k=8):
         self.n = n
         self.k = k
 
-        self.sk = ore.keygen(n, k)
+        self.sk = sk
+        self.key = ore.ORESecretKey(sk, n, k)
         return self
 
     def encrypt(self, y):
         if type(y) == str:
             y = int(y)
-        return ore.encrypt(y, self.sk, self.n, self.k)
+        return ore.encrypt(y, self.key, self.n, self.k)
+
+    # Computes only the left side of the ciphertext
+    def encrypt_left(self, y):
+        if type(y) == str:
+            y = int(y)
+        return ore.encrypt_left(y, self.key, self.n, self.k)
+
+    # Computes only the right side of the ciphertext
+    def encrypt_right(self, y):
+        if type(y) == str:
+            y = int(y)
+        return ore.encrypt_right(y, self.key, self.n, self.k)
+
+    # The native key can't be pickled (e.g. to reach multiprocessing
+    # workers). It is rebuilt from the exportable one.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("key", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.sk is not None:
+            self.set_key(self.sk, self.n, self.k)
 
     @staticmethod
     def compare(ctL, ctR, n=32, k=8):
         return ore.compare(n, k, ctL, ctR)
 
+    # Compares ctL against each element of ctRs in a single call
+    @staticmethod
+    def compare_many(ctL, ctRs, n=32, k=8):
+        return ore.compare_many(n, k, ctL, ctRs)
+
+    # Returns the indexes that sort a list of (ctL, ctR) pairs in ascending
+    # order. The sort is stable and runs entirely in C.
+    @staticmethod
+    def argsort(cts, n=32, k=8):
+        return ore.argsort(n, k, cts)
+
+    # Returns the first position of ctRs, sorted in ascending order, whose
+    # value is not less than the one encrypted in ctL
+    @staticmethod
+    def lower_bound(ctL, ctRs, n=32, k=8):
+        return ore.lower_bound(n, k, ctL, ctRs)
+
+    # Returns the first position of ctRs, sorted in ascending order, whose
+    # value is greater than the one encrypted in ctL
+    @staticmethod
+    def upper_bound(ctL, ctRs, n=32, k=8):
+        return ore.upper_bound(n, k, ctL, ctRs)
+
 if __name__ == '__main__':
     orelf = ORE()
     sk = orelf.keygen()
@@ -38,3 +93,16 @@ if __name__ == '__main__':
     assert ORE.compare(ctA[0], ctA[1]) == 0
     assert ORE.compare(ctA[0], ctB[1]) == 1
     assert ORE.compare(ctA[0], ctC[1]) == -1
+    assert ORE.compare_many(ctA[0], [ctA[1], ctB[1], ctC[1]]) == (0, 1, -1)
+    assert ORE.compare(orelf.encrypt_left(2), orelf.encrypt_right(1)) == 1
+
+    cts = [ctC, ctA, ctB, ctA]
+    order = ORE.argsort(cts)
+    assert order == (2, 1, 3, 0)
+    ctRs = [cts[i][1] for i in order]
+    assert ORE.lower_bound(ctA[0], ctRs) == 1
+    assert ORE.upper_bound(ctA[0], ctRs) == 3
+
+    import pickle
+    orelf2 = pickle.loads(pickle.dumps(orelf))
+    assert ORE.compare(orelf2.encrypt_left(2), ctA[1]) == 0
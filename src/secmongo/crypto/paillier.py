@@ -24,27 +24,123 @@ import os
 import sys
 import getopt
 import json
+import threading
+import collections
+import weakref
+import atexit
 import generate_prime as Prime
 from .cipher import Cipher
+from . import arithmetic
 from Crypto.Random import random
 from numpy import power
 
+#
+# Precomputed r^n mod n^2 factors for Paillier.encrypt. Background workers
+# refill the pool up to size whenever it drops below threshold. If the
+# pool runs dry, factors are computed on demand.
+#
+# backend: the arithmetic backend (see arithmetic.py) of the workers
+#
+class RandomnessPool:
+    # Running pools. They are stopped at exit, before the modules their
+    # workers use are torn down.
+    __running = weakref.WeakSet()
+
+    def __init__(self, n, size = 1024, threshold = None, workers = 1, backend = None):
+        assert size > 0
+        self.backend = arithmetic.get_backend(backend)
+        self.n = n
+        self.n2 = n*n
+        self.size = size
+        self.threshold = size/2 if threshold is None else threshold
+        assert 0 <= self.threshold <= size
+
+        self.__factors = collections.deque()
+        self.__refill = threading.Condition()
+        self.__stopped = False
+        self.__workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target = self.__work)
+            worker.daemon = True
+            worker.start()
+            self.__workers.append(worker)
+        RandomnessPool.__running.add(self)
+
+    def __len__(self):
+        return len(self.__factors)
+
+    def draw(self):
+        r = random.randrange(1,self.n)
+        return self.backend.powmod(r,self.n,self.n2)
+
+    def get(self):
+        try:
+            factor = self.__factors.popleft()
+        except IndexError:
+            factor = self.draw()
+        if len(self.__factors) < self.threshold:
+            with self.__refill:
+                self.__refill.notify()
+        return factor
+
+    def stop(self):
+        with self.__refill:
+            self.__stopped = True
+            self.__refill.notify_all()
+        for worker in self.__workers:
+            if worker is not threading.current_thread():
+                worker.join()
+        RandomnessPool.__running.discard(self)
+
+    @staticmethod
+    def stop_all():
+        for pool in list(RandomnessPool.__running):
+            pool.stop()
+
+    def __work(self):
+        while True:
+            with self.__refill:
+                while not self.__stopped and len(self.__factors) >= self.threshold:
+                    self.__refill.wait()
+                if self.__stopped:
+                    return
+            while not self.__stopped and len(self.__factors) < self.size:
+                self.__factors.append(self.draw())
+
+atexit.register(RandomnessPool.stop_all)
+
 class Paillier(Cipher):
-    rating_cts = None
+    # Arithmetic backend (see arithmetic.py)
+    backend = arithmetic.get_backend()
+    __context = None
+    __pool = None
+    __domains = None
+    # Default number of r^n factors kept by start_pool
+    POOL_SIZE = 1024
+    # Default width, in bits, of each slot of a packed plaintext
+    SLOT_BITS = 32
+
+    #
+    # backend: "gmpy2" or "python". The fastest one available, by default.
+    #
+    def __init__(self, keys=None, backend=None):
+        self.backend = arithmetic.get_backend(backend)
+        Cipher.__init__(self,keys)
 
     @staticmethod
-    def keygen(key_size=1024):
+    def keygen(key_size=1024, backend=None):
         # Generates a new key set
 
+        backend = arithmetic.get_backend(backend)
         n = None
         p = None
         q = None
-        while n is None or (p is not None and q is not None and Paillier.__egcd(n,(p-1)*(q-1))[0] != 1):
+        while n is None or (p is not None and q is not None and backend.gcd(n,(p-1)*(q-1)) != 1):
             while p is None or q is None:
                 try:
                     while p == q:
-                        p = Prime.generate_large_prime(key_size / 2)
-                        q = Prime.generate_large_prime(key_size / 2)  # i want p != q
+                        p = Prime.generate_large_prime(key_size / 2, backend)
+                        q = Prime.generate_large_prime(key_size / 2, backend)  # i want p != q
                 except Exception, err:
                     print(err)
                     p = None
@@ -59,7 +155,9 @@ class Paillier(Cipher):
                     "n":n,
                     "g":g},
                 "priv":{
-                 "lambda":l
+                 "lambda":l,
+                 "p":p,
+                 "q":q
                  }
                }
         
@@ -72,11 +170,63 @@ class Paillier(Cipher):
         Cipher.add_to_public_key(self,"r",r)
         return r
         
-    def encrypt(self,m):
+    #
+    # Starts a pool of r^n factors, filled by background workers, that
+    # encrypt draws from. An encryption then costs a single modular
+    # multiplication. The pool is not pickled.
+    #
+    def start_pool(self, size = None, threshold = None, workers = 1):
+        self.stop_pool()
+        pub = Cipher.get_public_key(self)
+        assert pub.has_key("n")
+        self.__pool = RandomnessPool(
+            pub["n"],
+            self.POOL_SIZE if size is None else size,
+            threshold,
+            workers,
+            self.backend
+            )
+        return self.__pool
+
+    def stop_pool(self):
+        if self.__pool is not None:
+            self.__pool.stop()
+            self.__pool = None
+
+    #
+    # Declares the small set of plaintexts an attribute may take, such as the
+    # possible ratings of a movie. g^m mod n^2 is kept for each of them, so
+    # encrypt(m, domain = name) only multiplies the stored ciphertext by a
+    # fresh r^n. Once a pool is started with start_pool, that costs a single
+    # modular multiplication. Ciphertexts of the same value still differ.
+    #
+    def add_domain(self, name, values):
+        pub = Cipher.get_public_key(self)
+        assert pub.has_key("n")
+        assert pub.has_key("g")
+
+        n = pub["n"]
+        n2 = n*n if not pub.has_key("n2") else pub["n2"]
+        g = pub["g"]
+        if self.__domains is None:
+            self.__domains = {}
+        domain = self.__domains.setdefault(name, {})
+        for m in values:
+            assert isinstance(m, (int, long))
+            # A negative exponent is taken as the inverse
+            domain[m] = self.backend.powmod(g,m,n2)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_Paillier__pool", None)
+        return state
+
+    #
+    # domain: the name given to add_domain, if m belongs to one
+    #
+    def encrypt(self,m,domain=None):
         if type(m) == str:
             m = int(m)
-        if m in range(6) and self.rating_cts:
-            return self.rating_cts[m]            
 
         assert isinstance(m, (int, long))
 
@@ -89,20 +239,62 @@ class Paillier(Cipher):
         if not pub.has_key("n2"):
             Cipher.add_to_public_key(self, "n2", n2)
         g = pub["g"]
-        r = pub["r"] if pub.has_key("r") else random.randrange(1,n)
+        r = pub["r"] if pub.has_key("r") else None
 
         assert abs(m) < n        
 
-        if m < 0:
-            g_m__n2 = self.__modinv(pow(g,-m,n2),n2)
+        if self.__domains is not None and m in self.__domains.get(domain, {}):
+            g_m__n2 = self.__domains[domain][m]
+        elif g == n+1:
+            # (1 + n)^m = 1 + m*n mod n^2
+            g_m__n2 = (1 + m*n) % n2
         else:
-            g_m__n2 = pow(g,m,n2)
-        c = g_m__n2*pow(r,n,n2) % n2
+            # A negative exponent is taken as the inverse
+            g_m__n2 = self.backend.powmod(g,m,n2)
+        if r is None and self.__pool is not None and self.__pool.n == n:
+            r_n__n2 = self.__pool.get()
+        else:
+            if r is None:
+                r = random.randrange(1,n)
+            r_n__n2 = self.backend.powmod(r,n,n2)
+        c = self.backend.mpz(g_m__n2)*r_n__n2 % n2
         return str(c)
 
     def decrypt(self,c):
-        c = int(c)    
+        return long(self.__decrypt(self.backend.mpz(c), self.__decryption_context()))
+
+    #
+    # Decrypts a sequence of ciphertexts. The constants of the private key
+    # are looked up once for all of them.
+    #
+    def decrypt_many(self,cs):
+        context = self.__decryption_context()
+        return [long(self.__decrypt(self.backend.mpz(c), context)) for c in cs]
+
+    def __decrypt(self,c,context):
+        powmod = self.backend.powmod
+        charmical_function = lambda u,n: (u-1)/n
+        if "p" not in context:
+            n = context["n"]
+            return charmical_function(powmod(c,context["lambda"],context["n2"]),n)*context["mu"] % n
+
+        # Two half-size exponentiations, modulo p^2 and q^2, combined with
+        # the CRT
+        p = context["p"]
+        q = context["q"]
+        mp = charmical_function(powmod(c % context["p2"],p-1,context["p2"]),p)*context["hp"] % p
+        mq = charmical_function(powmod(c % context["q2"],q-1,context["q2"]),q)*context["hq"] % q
+        return mq + ((mp - mq)*context["q_inv"] % p)*q
 
+    #
+    # The constants of the private key that decryption needs. They are
+    # computed on first use and again only if the key changes.
+    #
+    # If p and q are known, either kept by keygen or recovered from n and
+    # lambda = (p-1)*(q-1), decryption works modulo p^2 and q^2. Otherwise
+    # it works modulo n^2.
+    #
+    def __decryption_context(self):
         pub = Cipher.get_public_key(self)
         priv = Cipher.get_private_key(self)
 
@@ -110,22 +302,130 @@ class Paillier(Cipher):
         assert pub.has_key('g')
         assert priv.has_key('lambda')
 
+        key = (pub['n'], pub['g'], priv['lambda'], priv.get('p'), priv.get('q'), self.backend)
+        if self.__context is not None and self.__context["key"] == key:
+            return self.__context
+
         n = pub['n']
         n2 = n*n if not pub.has_key("n2") else pub["n2"]
         if not pub.has_key("n2"):
             Cipher.add_to_public_key(self, "n2", n2)
         g = pub['g']
         l = priv['lambda']
-        mi = pow(l,l-1,n)
+        p = priv.get('p')
+        q = priv.get('q')
+        if p is None or q is None:
+            p, q = Paillier.__factor(n, l)
 
+        mpz = self.backend.mpz
+        powmod = self.backend.powmod
+        invert = self.backend.invert
         charmical_function = lambda u,n: (u-1)/n
-        m = charmical_function(pow(c,l,n2),n)*mi % n
-        return m
+        context = {"key": key}
+        if p is None:
+            n = mpz(n)
+            context.update({
+                "n": n,
+                "n2": mpz(n2),
+                "lambda": mpz(l),
+                "mu": invert(charmical_function(powmod(g,l,n2),n),n)
+                })
+        else:
+            p = mpz(p)
+            q = mpz(q)
+            p2 = p*p
+            q2 = q*q
+            context.update({
+                "p": p,
+                "q": q,
+                "p2": p2,
+                "q2": q2,
+                "hp": invert(charmical_function(powmod(g % p2,p-1,p2),p),p),
+                "hq": invert(charmical_function(powmod(g % q2,q-1,q2),q),q),
+                "q_inv": invert(q,p)
+                })
+        self.__context = context
+        return context
+
+    #
+    # Recovers p and q from n and l = (p-1)*(q-1), as the roots of
+    # x^2 - (n - l + 1)x + n. Returns (None, None) if l is not of that form.
+    #
+    @staticmethod
+    def __factor(n, l):
+        s = n - l + 1
+        d = s*s - 4*n
+        if d < 0:
+            return None, None
+        r = Paillier.__isqrt(d)
+        if r*r != d or (s + r) % 2 != 0:
+            return None, None
+        p = (s + r)/2
+        q = (s - r)/2
+        if p*q != n or q <= 1:
+            return None, None
+        return p, q
+
+    @staticmethod
+    def __isqrt(x):
+        if x == 0:
+            return 0
+        r = 1 << ((x.bit_length() + 1)/2)
+        while True:
+            s = (r + x/r)/2
+            if s >= r:
+                return r
+            r = s
+
+    #
+    # Packing
+    #
+    # Several non-negative counters share one plaintext, each in a slot of
+    # slot_bits bits. The first counter takes the least significant slot.
+    # The product of two packed ciphertexts adds their counters slot by
+    # slot, so h_operation works on all of them at once, as long as no sum
+    # needs more than slot_bits bits (see slot_bits_for).
+    #
+    def slots(self, slot_bits = None):
+        slot_bits = self.SLOT_BITS if slot_bits is None else slot_bits
+        n = Cipher.get_public_key(self)["n"]
+        # Packed plaintexts must stay below n
+        return (n.bit_length() - 1) / slot_bits
+
+    #
+    # The smallest slot that holds the sum of nadditions values, none of
+    # them greater than max_value
+    #
+    @staticmethod
+    def slot_bits_for(max_value, nadditions):
+        return max(1, (max_value*nadditions).bit_length())
+
+    def encrypt_packed(self, values, slot_bits = None):
+        slot_bits = self.SLOT_BITS if slot_bits is None else slot_bits
+        assert len(values) <= self.slots(slot_bits)
+
+        m = 0
+        for i, value in enumerate(values):
+            assert isinstance(value, (int, long))
+            assert 0 <= value < 1 << slot_bits
+            m = m | (value << (i*slot_bits))
+        return self.encrypt(m)
+
+    #
+    # count: number of slots to return. All of them, by default.
+    #
+    def decrypt_packed(self, c, slot_bits = None, count = None):
+        slot_bits = self.SLOT_BITS if slot_bits is None else slot_bits
+        count = self.slots(slot_bits) if count is None else count
+
+        m = self.decrypt(c)
+        mask = (1 << slot_bits) - 1
+        return [(m >> (i*slot_bits)) & mask for i in range(count)]
 
     def h_operation(self,a,b,mod=None,fix=None):
         assert isinstance(a, (int, long))
         assert isinstance(b, (int, long))
-        a = long(a)    
+        a = self.backend.mpz(a)
         b = long(b)    
 
         if mod is None:
@@ -136,21 +436,3 @@ class Paillier(Cipher):
             c = a*b*fix % mod
 
         return str(c)
-
-    @staticmethod
-    def __egcd(a, b):
-        x,y, u,v = 0,1, 1,0
-        while a != 0:
-            q, r = b//a, b%a
-            m, n = x-u*q, y-v*q
-            b,a, x,y, u,v = a,r, u,v, m,n
-        gcd = b
-        return gcd, x, y
-
-    @staticmethod
-    def __modinv(a, m):
-        gcd, x, y = Paillier.__egcd(a, m)
-        if gcd != 1:
-            return None  # modular inverse does not exist
-        else:
-            return x % m
\ No newline at end of file
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding:utf-8
+##########################################################################
+##########################################################################
+#
+# mongodb-secure
+# Copyright (C) 2016, Pedro Alves and Diego Aranha
+# {pedro.alves, dfaranha}@ic.unicamp.br
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+##########################################################################
+# About this class:
+#
+# - It is returned by the lookups of SecMongo, which find the _ids of the
+#   matching documents in an index tree
+# - The _ids are consumed as the index is walked and the documents are
+#   fetched in batches of batch_size, so the first ones arrive before the
+#   walk is over and the size of each $in is bounded
+# - Like pymongo's Cursor, limit(), skip() and batch_size() must be called
+#   before the iteration starts
+#
+from pymongo.errors import InvalidOperation
+
+
+class SecMongoCursor(object):
+    DEFAULT_BATCH_SIZE = 1000
+
+    # collection: where the documents are
+    # references: a function that returns an iterable over lists of _ids.
+    #             It is called again by rewind().
+    def __init__(self, collection, references, projection = None, batch_size = None):
+        self.__collection = collection
+        self.__references = references
+        self.__projection = projection
+        self.__batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.__limit = 0
+        self.__skip = 0
+        self.__documents = None
+
+    def __check_okay_to_chain(self):
+        if self.__documents is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    # Returns at most limit documents. 0 means no limit.
+    def limit(self, limit):
+        assert limit >= 0
+        self.__check_okay_to_chain()
+        self.__limit = limit
+        return self
+
+    # Skips the first skip documents
+    def skip(self, skip):
+        assert skip >= 0
+        self.__check_okay_to_chain()
+        self.__skip = skip
+        return self
+
+    # Number of _ids in each query sent to the collection
+    def batch_size(self, batch_size):
+        assert batch_size > 0
+        self.__check_okay_to_chain()
+        self.__batch_size = batch_size
+        return self
+
+    # Restarts the lookup, which will run again on the next iteration
+    def rewind(self):
+        self.close()
+        return self
+
+    def close(self):
+        if self.__documents is not None:
+            self.__documents.close()
+        self.__documents = None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.__documents is None:
+            self.__documents = self.__generate()
+        return next(self.__documents)
+
+    __next__ = next
+
+    def __fetch(self, ids):
+        return self.__collection.find(
+            {"_id": {"$in": ids}},
+            projection = self.__projection
+        )
+
+    def __generate(self):
+        skip = self.__skip
+        limit = self.__limit
+        batch = []
+        for references in self.__references():
+            for _id in references:
+                if skip > 0:
+                    skip = skip - 1
+                    continue
+                batch.append(_id)
+                if len(batch) == self.__batch_size or len(batch) == limit:
+                    for document in self.__fetch(batch):
+                        yield document
+                    if limit > 0:
+                        limit = limit - len(batch)
+                        if limit == 0:
+                            return
+                    batch = []
+        if len(batch) > 0:
+            for document in self.__fetch(batch):
+                yield document
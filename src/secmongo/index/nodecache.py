@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding:utf-8
+##########################################################################
+##########################################################################
+#
+# mongodb-secure
+# Copyright (C) 2016, Pedro Alves and Diego Aranha
+# {pedro.alves, dfaranha}@ic.unicamp.br
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+##########################################################################
+# About this class:
+#
+# - It keeps index nodes fetched from the database in memory, keyed by
+#   (iname, iname_id)
+# - The memory budget is given in bytes and measured as the BSON size of
+#   the cached nodes
+# - Once the budget is exceeded, the least recently used nodes are evicted
+# - It also remembers the iname_id of the root of each index tree
+# - It may be shared by threads walking different trees
+#
+from collections import OrderedDict
+from bson import BSON
+import threading
+
+
+class NodeCache(object):
+    budget = 0
+    size = 0
+    hits = 0
+    misses = 0
+
+    def __init__(self, budget):
+        assert budget >= 0
+        self.budget = budget
+        self.__nodes = OrderedDict()  # (iname, iname_id) -> (node, size)
+        self.__roots = {}  # iname -> iname_id
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__nodes)
+
+    def __contains__(self, key):
+        return key in self.__nodes
+
+    def get(self, iname, iname_id):
+        with self.__lock:
+            key = (iname, iname_id)
+            entry = self.__nodes.pop(key, None)
+            if entry is None:
+                self.misses = self.misses + 1
+                return None
+            # Move it to the most recently used end
+            self.__nodes[key] = entry
+            self.hits = self.hits + 1
+            return entry[0]
+
+    def put(self, node):
+        if self.budget == 0:
+            return
+        key = (node["iname"], node["iname_id"])
+        node_size = len(BSON.encode(node))
+        with self.__lock:
+            self.invalidate(*key)
+            if node_size > self.budget:
+                return
+            self.__nodes[key] = (node, node_size)
+            self.size = self.size + node_size
+            while self.size > self.budget:
+                _, (_, evicted_size) = self.__nodes.popitem(last=False)
+                self.size = self.size - evicted_size
+
+    def invalidate(self, iname, iname_id):
+        with self.__lock:
+            entry = self.__nodes.pop((iname, iname_id), None)
+            if entry is not None:
+                self.size = self.size - entry[1]
+
+    # Drops every node of a tree and its root
+    def invalidate_iname(self, iname):
+        with self.__lock:
+            for key in [key for key in self.__nodes if key[0] == iname]:
+                self.invalidate(*key)
+            self.__roots.pop(iname, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__nodes.clear()
+            self.__roots.clear()
+            self.size = 0
+
+    def get_root(self, iname):
+        return self.__roots.get(iname)
+
+    def set_root(self, iname, iname_id):
+        if self.budget > 0:
+            self.__roots[iname] = iname_id
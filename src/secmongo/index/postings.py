@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding:utf-8
+##########################################################################
+##########################################################################
+#
+# mongodb-secure
+# Copyright (C) 2016, Pedro Alves and Diego Aranha
+# {pedro.alves, dfaranha}@ic.unicamp.br
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+##########################################################################
+# About this module:
+#
+# - It compresses the references of an index node, when they are
+#   non-negative integers, into a list of blocks of up to BLOCK_SIZE ids
+# - The ids are sorted and each block is stored either as varint encoded
+#   deltas or as a bitmap, whichever is smaller
+# - Blocks are decoded lazily, so sorted streams of ids can be merged and
+#   intersected without materialising them
+#
+import heapq
+
+BLOCK_SIZE = 4096
+
+DELTAS = 0
+BITMAP = 1
+
+
+def compressible(ids):
+    return all(type(x) in (int, long) and x >= 0 for x in ids)
+
+
+def encode_varint(x, out):
+    while x >= 0x80:
+        out.append((x & 0x7f) | 0x80)
+        x = x >> 7
+    out.append(x)
+
+
+def decode_varint(data, pos):
+    x = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos = pos + 1
+        x = x | ((b & 0x7f) << shift)
+        if b < 0x80:
+            return x, pos
+        shift = shift + 7
+
+
+# Encodes a sorted list of distinct ids as a single block
+def encode_block(ids):
+    deltas = bytearray([DELTAS])
+    encode_varint(len(ids), deltas)
+    encode_varint(ids[0], deltas)
+    for previous, x in zip(ids, ids[1:]):
+        encode_varint(x - previous, deltas)
+
+    span = ids[-1] - ids[0] + 1
+    if (span + 7) / 8 + 1 < len(deltas):
+        bitmap = bytearray([BITMAP])
+        encode_varint(ids[0], bitmap)
+        bits = bytearray((span + 7) / 8)
+        for x in ids:
+            x = x - ids[0]
+            bits[x >> 3] = bits[x >> 3] | (1 << (x & 7))
+        return bytes(bitmap + bits)
+    return bytes(deltas)
+
+
+def decode_block(data):
+    data = bytearray(data)
+    if data[0] == DELTAS:
+        count, pos = decode_varint(data, 1)
+        x, pos = decode_varint(data, pos)
+        yield x
+        for _ in range(count - 1):
+            delta, pos = decode_varint(data, pos)
+            x = x + delta
+            yield x
+    else:
+        assert data[0] == BITMAP
+        first, pos = decode_varint(data, 1)
+        for i in range(pos, len(data)):
+            b = data[i]
+            base = first + (i - pos)*8
+            while b:
+                low = b & -b
+                yield base + low.bit_length() - 1
+                b = b ^ low
+
+
+# Sorts and deduplicates ids and returns their encoded blocks
+def encode(ids, block_size = BLOCK_SIZE):
+    ids = sorted(set(ids))
+    return [encode_block(ids[i:i+block_size]) for i in range(0, len(ids), block_size)]
+
+
+# Returns the ids stored in a sequence of blocks, in ascending order
+def decode(blocks):
+    for block in blocks:
+        for x in decode_block(block):
+            yield x
+
+
+# Merges sorted streams of ids into a single sorted stream
+def union(*streams):
+    return heapq.merge(*streams)
+
+
+# Yields the ids present in every one of the sorted streams. Only as much of
+# each stream as needed is decoded.
+def intersect(*streams):
+    if len(streams) == 0:
+        return
+    iterators = [iter(x) for x in streams]
+    try:
+        current = [next(x) for x in iterators]
+        while True:
+            high = max(current)
+            if all(x == high for x in current):
+                yield high
+                current = [next(x) for x in iterators]
+                continue
+            for i, it in enumerate(iterators):
+                while current[i] < high:
+                    current[i] = next(it)
+    except StopIteration:
+        return
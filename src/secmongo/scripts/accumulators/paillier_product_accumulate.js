@@ -0,0 +1,4 @@
+function(state, ct){
+    state.product = (BigInt(state.product) * BigInt(ct) % BigInt(state.n2)).toString();
+    return state;
+}
@@ -0,0 +1,3 @@
+function(state){
+    return state.product;
+}
@@ -0,0 +1,4 @@
+function(n2){
+    // BigInts cannot be stored in the state, so it keeps decimal strings
+    return {product: "1", n2: n2};
+}
@@ -0,0 +1,4 @@
+function(state1, state2){
+    state1.product = (BigInt(state1.product) * BigInt(state2.product) % BigInt(state1.n2)).toString();
+    return state1;
+}
@@ -30,25 +30,33 @@ function(collection, node){
         }
     }
 
+    var node_set, right_set, inner;
     // Set node's right child to right's original right child update parent
     // of node to original right child.
+    node_set = {right: right['left'], parent: right['_id'],
+        height: 1 + Math.max(
+            get_height(collection.findOne({_id: node['left']})),
+            get_height(collection.findOne({_id: right['left']}))
+        )};
+    // Set orginal right's parent to node's original parent.
+    right_set = {parent: node['parent'], left: node['_id']};
+    // Keep subtree sizes so that count() can still answer from the root.
+    // node loses right but gains right's original left subtree.
+    if(node['size'] != null){
+        inner = collection.findOne({_id: right['left']});
+        right_set['size'] = node['size'];
+        node_set['size'] = node['size'] - right['size'] + (inner != null ? inner['size'] : 0);
+    }
     collection.updateOne(
         {_id: node['_id']},
-        {$set: {right: right['left'], parent: right['_id'],
-            height: 1 + Math.max(
-                get_height(collection.findOne({_id: node['left']})),
-                get_height(collection.findOne({_id: right['left']}))
-            )}
-        }
+        {$set: node_set}
+    );
+    right_set['height'] = 1 + Math.max(
+        get_height(collection.findOne({_id: node['_id']})),
+        get_height(collection.findOne({_id: right['right']}))
     );
-    // Set orginal right's parent to node's original parent.
     collection.updateOne(
         {_id: right['_id']},
-        {$set: {parent: node['parent'], left: node['_id'],
-            height: 1 + Math.max(
-                get_height(collection.findOne({_id: node['_id']})),
-                get_height(collection.findOne({_id: right['right']}))
-            )}
-        }
+        {$set: right_set}
     );
-}
\ No newline at end of file
+}
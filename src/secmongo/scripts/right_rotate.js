@@ -30,28 +30,35 @@ function(collection, node){
         }
     }
 
+    var node_set, left_set, inner;
     // Set node's left child to left's original right child update parent
     // of node to original right child.
+    node_set = {
+        left: left['right'], parent: left['_id'],
+        height: 1 + Math.max(
+            get_height(collection.findOne({_id: left['right']})),
+            get_height(collection.findOne({_id: node['right']}))
+        )};
+    // Set orginal left's parent to node's original parent.
+    left_set = {parent: node['parent'], right: node['_id']};
+    // Keep subtree sizes so that count() can still answer from the root.
+    // node loses left but gains left's original right subtree.
+    if(node['size'] != null){
+        inner = collection.findOne({_id: left['right']});
+        left_set['size'] = node['size'];
+        node_set['size'] = node['size'] - left['size'] + (inner != null ? inner['size'] : 0);
+    }
     collection.updateOne(
         {_id: node['_id']},
-        {$set: {
-            left: left['right'], parent: left['_id'],
-            height: 1 + Math.max(
-                get_height(collection.findOne({_id: left['right']})),
-                get_height(collection.findOne({_id: node['right']}))
-            )}
-        }
+        {$set: node_set}
+    );
+    left_set['height'] = 1 + Math.max(
+        get_height(collection.findOne({_id: left['left']})),
+        get_height(collection.findOne({_id: node['_id']}))
     );
-    // Set orginal left's parent to node's original parent.
     collection.updateOne(
         {_id: left['_id']},
-        {$set: {
-            parent: node['parent'], right: node['_id'],
-            height: 1 + Math.max(
-                get_height(collection.findOne({_id: left['left']})),
-                get_height(collection.findOne({_id: node['_id']}))
-            )}
-        }
+        {$set: left_set}
     );
 
 }
\ No newline at end of file
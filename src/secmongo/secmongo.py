@@ -22,18 +22,26 @@
 ##########################################################################
 ##########################################################################
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
 from .crypto import paillier
 from .crypto import elgamal
 from .crypto.ore import ORE
 from .index.avltree import AVLTree
 from .index.indexnode import IndexNode
+from .index.nodecache import NodeCache
+from .index import postings
+from .cursor import SecMongoCursor
 from bson.json_util import dumps
-from multiprocessing import Queue
 from bson import ObjectId
+from bson.binary import Binary
 import json
 import time
 import os
+import sys
+import threading
+import warnings
+import Queue
 from itertools import chain,islice
 
 class StopLookingForThings(Exception):
@@ -51,12 +59,40 @@ class SecMongo:
     client = None
     db = None
     collection = None
+    index_collection = None
+    page_collection = None
+    postings_collection = None
+    __has_indexes = False
+    __accumulator_scripts = None
+
+    # Number of ctRs in each page of a B+tree index
+    PAGE_FANOUT = 256
+    # Memory budget, in bytes, of the index node cache
+    NODE_CACHE_SIZE = 32*2**20
+    # Distance between the ranks of consecutive nodes in a bulk built index.
+    # insert_index places new nodes in these gaps.
+    RANK_GAP = 2**16
+    # Compressed references of a node larger than this, in bytes, are moved
+    # to postings_<collection>
+    POSTINGS_INLINE_SIZE = 64*2**10
+    # Number of operations in each bulk write issued by update
+    BULK_SIZE = 1000
+    # Number of _ids matched by each aggregation of aggregate_sum
+    AGGREGATE_SIZE = 100000
+    # Whether aggregate_sum multiplies the ciphertexts on the server. Cleared
+    # once the server refuses a $accumulator.
+    SERVER_AGGREGATION = True
 
     __ciphers = {"references": None, "h_add": None, "h_mul": None}
 
-    def __init__(self, add_cipher_param=None, url=None):
+    def __init__(self, add_cipher_param=None, url=None, cache_size=None):
         assert url is None or type(url) == str
 
+        # Index nodes fetched by this client. A cache_size of 0 disables it.
+        self.node_cache = NodeCache(
+            self.NODE_CACHE_SIZE if cache_size is None else cache_size
+        )
+
         # Connects to database
         if url:
             self.client = MongoClient(url)
@@ -88,6 +124,40 @@ class SecMongo:
         assert type(collection) is str
         self.collection = self.db[collection]
         self.index_collection = self.db["references_"+collection]
+        self.page_collection = self.db["pages_"+collection]
+        self.postings_collection = self.db["postings_"+collection]
+        self.node_cache.clear()
+        self.__ensure_indexes()
+
+    #
+    # Creates the secondary indexes that node lookups rely on. Nodes are
+    # fetched by (iname, iname_id), roots by (iname, parent) and ranges of
+    # nodes by (iname, rank). Pages are fetched by (iname, page_id) and roots
+    # by (iname, root). The overflow blocks of compressed references are
+    # fetched by (iname, iname_id, block). Mongo ignores the request if an
+    # index already exists.
+    #
+    def __ensure_indexes(self):
+        self.index_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("iname_id", pymongo.ASCENDING)]
+        )
+        self.index_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("parent", pymongo.ASCENDING)]
+        )
+        self.index_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("rank", pymongo.ASCENDING)]
+        )
+        self.page_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("page_id", pymongo.ASCENDING)]
+        )
+        self.page_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("root", pymongo.ASCENDING)]
+        )
+        self.postings_collection.create_index(
+            [("iname", pymongo.ASCENDING), ("iname_id", pymongo.ASCENDING),
+             ("block", pymongo.ASCENDING)]
+        )
+        self.__has_indexes = True
 
     # Executes a single lookup operation.
     # 
@@ -107,151 +177,327 @@ class SecMongo:
         # This method expects an index value (the ctL)
         ctL = index  # a
 
+        def references():
+            for node in self.__find_nodes(iname, relationship, ctL):
+                yield self.__node_references(node)
+        return self.__results(references, projection, return_ids)
+
+    def find_range(self,
+            index = None,
+            projection = None,
+            iname = None,
+            return_ids = False):
+
+        if index is None:
+            return self.collection.find()
+        else:
+            assert type(index) in (list, tuple) and len(index) == 2
+
+        # Search by an index
+        # This method expects an index value (the ctL)
+        start_ctL, end_ctL = index 
+
+        def references():
+            for node in self.__find_range_nodes(iname, start_ctL, end_ctL):
+                yield self.__node_references(node)
+        return self.__results(references, projection, return_ids)
+
+    #
+    # The nodes of the index tree of iname that find() returns
+    #
+    def __find_nodes(self, iname, relationship, ctL):
         #  To search for elements with an attribute named "age" with a value
         #  between 30 and 40
         #
         #  The query MUST be encrypted
-        # Get the tree root
-        queue = Queue()
-        queue.put(self.index_collection.find_one({"parent": None, "iname":iname}))
-        result = []
-        niterations = 0
-        while queue.qsize() > 0:
-            node = queue.get() # consume
-            while node is None and queue.qsize() > 0:
-                node = queue.get() # consume
-            if node is None:
-                break # End
-
-            ctR = node["ctR"]  # b
-            r = self.__ciphers["references"].compare(ctL, ctR)
+        def step(node, r):
+            r, = r
             if relationship == 0: # Equality
                 if r == 0:
                     # Found
                     # a == b
-                    result.extend(node["references"])
+                    return True, []
                 elif r == 1:
                     # a < b
-                    if node["right"] is not None:
-                        queue.put(self.index_collection.find_one(
-                            {"iname_id": node["right"], "iname": iname})
-                        )
+                    return False, [node["right"]]
                 else:
                     assert r == -1
                     # a > b
-                    if node["left"] is not None:
-                        queue.put(self.index_collection.find_one(
-                            {"iname_id": node["left"], "iname": iname})
-                        )
+                    return False, [node["left"]]
             elif relationship == 1: # > than
                 if r == 0 or r == -1:
-                    if node["left"] is not None:
-                        queue.put(self.index_collection.find_one(
-                            {"iname_id": node["left"], "iname": iname})
-                        )
+                    return False, [node["left"]]
                 else:
                     assert r == 1
                     # Found
-                    result.extend(node["references"])
-                    if node["left"] is not None:
-                        queue.put( self.index_collection.find_one(
-                            {"iname_id": node["left"], "iname": iname}))
-                    if node["right"] is not None:
-                        queue.put( self.index_collection.find_one(
-                            {"iname_id": node["right"], "iname": iname}))
+                    return True, [node["left"], node["right"]]
             else: # < than
                 assert relationship == -1
                 if r == 0 or r == 1:
-                    if node["right"] is not None:
-                        queue.put( self.index_collection.find_one(
-                            {"iname_id": node["right"], "iname": iname}))
+                    return False, [node["right"]]
                 else:
                     assert r == -1
                     # Found
-                    result.extend(node["references"])
-                    if node["left"] is not None:
-                        queue.put( self.index_collection.find_one(
-                            {"iname_id": node["left"], "iname": iname}))
-                    if node["right"] is not None:
-                        queue.put( self.index_collection.find_one(
-                            {"iname_id": node["right"], "iname": iname}))
-            niterations = niterations + 1
-        print "%d iterations to find the result" % niterations
-        # print "Result: %d docs" % len(result)
-        if return_ids:
-            return result
-        else:
-            return self.collection.find({"_id": {"$in": result}}, projection = projection)
+                    return True, [node["left"], node["right"]]
 
-    def find_range(self,
-            index = None,
-            projection = None,
-            iname = None,
-            return_ids = False):
-
-        if index is None:
-            return self.collection.find()
-        else:
-            assert type(index) in (list, tuple) and len(index) == 2
+        return self.__walk_index(iname, [ctL], step)
 
-        # Search by an index
-        # This method expects an index value (the ctL)
-        start_ctL, end_ctL = index 
+    #
+    # The nodes of the index tree of iname that find_range() returns
+    #
+    def __find_range_nodes(self, iname, start_ctL, end_ctL):
         #  To search for elements with an attribute named "age" with a value
         #  between 30 and 40
         #
         #  The query MUST be encrypted
-        # Get the tree root
-        queue = Queue()
-        queue.put(self.index_collection.find_one({"parent": None, "iname":iname}))
-        result = []
-        niterations = 0
-        while queue.qsize() > 0:
-            node = queue.get() # consume
-            while node is None and queue.qsize() > 0:
-                node = queue.get() # consume
-            if node is None:
-                break # End
-
-            ctR = node["ctR"]  # b
-            r_start = self.__ciphers["references"].compare(start_ctL, ctR)
-            r_end = self.__ciphers["references"].compare(end_ctL, ctR)
+        def step(node, r):
+            r_start, r_end = r
             if r_start == 0:
-                result.extend(node["references"])
-                if node["right"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["right"], "iname": iname}))
+                return True, [node["right"]]
             elif r_end == 0:
-                result.extend(node["references"])
-                if node["left"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["left"], "iname": iname}))
+                return True, [node["left"]]
             elif r_start == -1 and r_end == 1: # in the interval
-                result.extend(node["references"])
-                if node["left"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["left"], "iname": iname}))
-                if node["right"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["right"], "iname": iname}))
+                return True, [node["left"], node["right"]]
             elif r_start == 1 and r_end == 1:
-                if node["right"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["right"], "iname": iname}))
+                return False, [node["right"]]
             elif r_start == -1 and r_end == -1:
-                if node["left"] is not None:
-                    queue.put( self.index_collection.find_one(
-                        {"iname_id": node["left"], "iname": iname}))
+                return False, [node["left"]]
+            return False, []
 
-            niterations = niterations + 1
-        print "%d iterations to find the result" % niterations
-        # print "Result: %d docs" % len(result)
-        if return_ids:
-            return result
+        root = self.__get_root(iname)
+        if root is not None and root.get("rank") is not None:
+            return self.__find_range_by_rank(iname, root, start_ctL, end_ctL)
+        else:
+            # The tree was not built with ranks
+            return self.__walk_index(iname, [start_ctL, end_ctL], step)
+
+    #
+    # The _ids referenced by a node. Compressed references are decoded as
+    # they are read and, if they do not fit in the node, their blocks are
+    # fetched from postings_<collection>. References added by insert_index
+    # after the node was compressed are kept in plain form.
+    #
+    # ordered: return the _ids in ascending order
+    #
+    def __node_references(self, node, ordered = False):
+        if "postings" not in node:
+            if ordered:
+                return sorted(node["references"])
+            return node["references"]
+        if node.get("overflow"):
+            blocks = (x["data"] for x in self.postings_collection.find(
+                {"iname": node["iname"], "iname_id": node["iname_id"]},
+                projection = ["data"]
+            ).sort("block", pymongo.ASCENDING))
         else:
-            return self.collection.find({"_id": {"$in": result}}, projection = projection)
+            blocks = node["postings"]
+        return postings.union(postings.decode(blocks), sorted(node["references"]))
+
+    #
+    # Delivers the outcome of a lookup. references is a function that
+    # returns an iterable over the lists of _ids found in the index.
+    #
+    # return_ids: Return a list with ids, if True. Else, return a cursor that
+    #             fetches the documents in batches as the index is walked.
+    #
+    def __results(self, references, projection, return_ids):
+        if return_ids:
+            return list(chain.from_iterable(references()))
+        return SecMongoCursor(self.collection, references, projection = projection)
+
+    #
+    # Counts the references to values that satisfy a relationship with ctL
+    # without fetching any document. Accepts the same relationships as
+    # find().
+    #
+    def count(self, iname, relationship, ctL):
+        root = self.__get_root(iname)
+        if root is None:
+            return 0
+        if "size" not in root:
+            # The tree was not built with counts
+            return len(self.find(index = ctL, relationship = relationship,
+                                 iname = iname, return_ids = True))
+        return self.__count_descent(iname, root, ctL, relationship)
+
+    #
+    # Counts the references to values in the interval [start, end]. index is
+    # a pair [start_ctL, end_ctL], as in find_range().
+    #
+    def count_range(self, iname, index):
+        assert type(index) in (list, tuple) and len(index) == 2
+        start_ctL, end_ctL = index
+
+        root = self.__get_root(iname)
+        if root is None:
+            return 0
+        if "size" not in root:
+            # The tree was not built with counts
+            return len(self.find_range(index = index, iname = iname, return_ids = True))
+        lower = self.__count_descent(iname, root, start_ctL, self.GREATER_OP)
+        greater = self.__count_descent(iname, root, end_ctL, self.LOWER_OP)
+        return max(0, root["size"] - lower - greater)
+
+    #
+    # Descends the tree of iname looking for ctL and adds up the subtree
+    # sizes left behind on the side given by relationship. Both children of
+    # a node are fetched together, so each level costs one round trip.
+    #
+    def __count_descent(self, iname, root, ctL, relationship):
+        compare = self.__ciphers["references"].compare
+        size = lambda node: node["size"] if node is not None else 0
+
+        total = 0
+        node = root
+        while node is not None:
+            children = self.__fetch_nodes(
+                iname, [x for x in (node["left"], node["right"]) if x is not None]
+            )
+            children = dict((x["iname_id"], x) for x in children)
+            left = children.get(node["left"])
+            right = children.get(node["right"])
+
+            r = compare(ctL, node["ctR"])
+            if r == 0:
+                if relationship == self.EQUALITY_OP:
+                    return node["count"]
+                elif relationship == self.GREATER_OP:
+                    return total + size(left)
+                else:
+                    return total + size(right)
+            elif r == 1:
+                # ctL is greater than this node
+                if relationship == self.GREATER_OP:
+                    total = total + node["count"] + size(left)
+                node = right
+            else:
+                # ctL is lower than this node
+                if relationship == self.LOWER_OP:
+                    total = total + node["count"] + size(right)
+                node = left
+        return total
+
+    #
+    # Finds the first node not lower than start_ctL and the last node not
+    # greater than end_ctL. Both descents share their round trips. Every node
+    # ranked between those two is then read with a single query, without any
+    # ORE compare.
+    #
+    # Yields each node in the range.
+    #
+    def __find_range_by_rank(self, iname, root, start_ctL, end_ctL):
+        compare = self.__ciphers["references"].compare
+
+        # Each descent is [ctL, current node, boundary found so far]
+        descents = [[start_ctL, root, None], [end_ctL, root, None]]
+        while any(node is not None for _, node, _ in descents):
+            next_level = []
+            for i, (ctL, node, _) in enumerate(descents):
+                if node is None:
+                    next_level.append(None)
+                    continue
+                r = compare(ctL, node["ctR"])
+                if r == 0:
+                    descents[i][2] = node
+                    next_level.append(None)
+                elif i == 0 and r == -1:
+                    # start < node. Look for a lower one.
+                    descents[i][2] = node
+                    next_level.append(node["left"])
+                elif i == 1 and r == 1:
+                    # end > node. Look for a greater one.
+                    descents[i][2] = node
+                    next_level.append(node["right"])
+                else:
+                    next_level.append(node["right"] if i == 0 else node["left"])
+            nodes = self.__fetch_nodes(iname, list(set(x for x in next_level if x is not None)))
+            nodes = dict((node["iname_id"], node) for node in nodes)
+            for i, iname_id in enumerate(next_level):
+                descents[i][1] = nodes.get(iname_id)
+
+        first = descents[0][2]
+        last = descents[1][2]
+        if first is None or last is None or first["rank"] > last["rank"]:
+            return
+        for node in self.index_collection.find(
+            {"iname": iname, "rank": {"$gte": first["rank"], "$lte": last["rank"]}},
+            projection = ["iname", "iname_id", "references", "postings", "overflow"]
+        ):
+            yield node
+
+    #
+    # Fetches a whole level of an index tree with a single query. Nodes
+    # found in the node cache are not requested.
+    #
+    # iname_ids: the iname_id of each node in the level
+    #
+    def __fetch_nodes(self, iname, iname_ids):
+        nodes = []
+        missing = []
+        for iname_id in iname_ids:
+            node = self.node_cache.get(iname, iname_id)
+            if node is None:
+                missing.append(iname_id)
+            else:
+                nodes.append(node)
+        if len(missing) == 0:
+            return nodes
+        for node in self.index_collection.find(
+            {"iname_id": {"$in": missing}, "iname": iname}
+        ):
+            self.node_cache.put(node)
+            nodes.append(node)
+        return nodes
+
+    #
+    # Returns the root of the index tree of iname, or None if it is empty
+    #
+    def __get_root(self, iname):
+        iname_id = self.node_cache.get_root(iname)
+        if iname_id is not None:
+            node = self.node_cache.get(iname, iname_id)
+            if node is not None:
+                return node
+        node = self.index_collection.find_one({"parent": None, "iname": iname})
+        if node is not None:
+            self.node_cache.set_root(iname, node["iname_id"])
+            self.node_cache.put(node)
+        return node
+
+    #
+    # Walks the index tree of iname one level at a time. Each level costs a
+    # single round trip to the database, so the latency grows with the height
+    # of the tree and not with the number of visited nodes.
+    #
+    # ctLs: the query ciphertexts. All nodes in a level are compared against
+    #       each of them before the next level is fetched.
+    # step: receives a node and its comparison outcomes (one for each ctL)
+    #       and returns a tuple (found, children). found tells if the node
+    #       belongs to the result and children lists the iname_ids that must
+    #       be visited in the next level.
+    #
+    # Yields the nodes that belong to the result.
+    #
+    def __walk_index(self, iname, ctLs, step):
+        compare_many = self.__ciphers["references"].compare_many
 
-    def find_nested(self, queries, return_ids = False):
+        # Get the tree root
+        root = self.__get_root(iname)
+        frontier = [root] if root is not None else []
+        while len(frontier) > 0:
+            ctRs = [node["ctR"] for node in frontier]  # b
+            outcomes = zip(*[compare_many(ctL, ctRs) for ctL in ctLs])
+
+            next_level = []
+            for node, r in zip(frontier, outcomes):
+                found, children = step(node, r)
+                if found:
+                    yield node
+                next_level.extend([x for x in children if x is not None])
+
+            frontier = self.__fetch_nodes(iname, next_level)
+
+    def find_nested(self, queries, return_ids = False, parallel = False):
         # Receives a sequence of operations that should be executed.
         # Each operation works on the outcome of the previous.
         # 
@@ -259,72 +505,283 @@ class SecMongo:
         # 
         # [ {"age", 1, 5}, {"hair", 0, "brown"}]
         # 
-        query_results = []
+        # The most selective operation runs first. Each of the others either
+        # runs on the index or, if there are fewer candidates left than the
+        # references it would return, is checked against the candidates.
+        #
+        # parallel: walks the index of every operation at the same time, one
+        #           thread each, instead of planning them.
+        #
+        # The candidates are kept in ascending order, so the references read
+        # from the index are merged and intersected with them as they are
+        # decoded.
+        #
+        if parallel:
+            result = self.__find_nested_parallel(queries)
+            if return_ids:
+                return result
+            else:
+                return SecMongoCursor(self.collection, lambda: [result])
 
+        plan = []
         for i, query in enumerate(queries):
-            iname, relationship, value = query
+            estimate = self.__estimate(*query)
+            plan.append((float("inf") if estimate is None else estimate, i, query))
+        plan.sort()
 
-            if relationship == self.RANGE_OP:
-                # range
-                # The outcome for this condition
-                query_results.append(self.find_range(
-                    index = value,
-                    projection = ["_id"],
-                    iname = iname,
-                    return_ids = True
-                ))
+        result = None
+        for estimate, i, query in plan:
+            iname, relationship, value = query
+            if estimate == 0:
+                result = []
+            elif result is not None and len(result) < estimate:
+                filtered = self.__filter(result, iname, relationship, value)
+                if filtered is not None:
+                    result = sorted(filtered)
+                else:
+                    result = list(postings.intersect(result, self.__lookup_ids(*query)))
             else:
-                # The outcome for this condition
-                query_results.append(self.find(
-                    index = value,
-                    iname = iname,
-                    relationship = relationship,
-                    projection = ["_id"],
-                    return_ids = True
-                ))
-
-        result = []
-        for query_result in query_results:
+                query_result = self.__lookup_ids(*query)
+                result = list(query_result if result is None else postings.intersect(result, query_result))
             if len(result) == 0:
-                result.extend(query_result)
-            else:
-                result = set(result).intersection(set(query_result))
+                # Nothing left to intersect
+                break
+
+        result = result or []
         if return_ids:
-            return list(result)
+            return result
+        else:
+            return SecMongoCursor(self.collection, lambda: [result])
+
+    #
+    # Runs each operation of find_nested in its own thread and intersects
+    # their outcomes as they arrive. Returns as soon as the intersection is
+    # empty, leaving the remaining walks behind.
+    #
+    def __find_nested_parallel(self, queries):
+        outcomes = Queue.Queue()
+
+        def lookup(query):
+            try:
+                outcomes.put((list(self.__lookup_ids(*query)), None))
+            except Exception:
+                outcomes.put((None, sys.exc_info()))
+
+        for query in queries:
+            worker = threading.Thread(target = lookup, args = (query,))
+            worker.daemon = True
+            worker.start()
+
+        result = None
+        for _ in queries:
+            query_result, error = outcomes.get()
+            if error is not None:
+                raise error[0], error[1], error[2]
+            result = query_result if result is None else list(postings.intersect(result, query_result))
+            if len(result) == 0:
+                break
+        return result or []
+
+    #
+    # The _ids that satisfy a single operation of find_nested, in ascending
+    # order
+    #
+    def __lookup_ids(self, iname, relationship, value):
+        if relationship == self.RANGE_OP:
+            nodes = self.__find_range_nodes(iname, value[0], value[1])
         else:
-            return self.collection.find({"_id":{"$in": list(result)}})
+            nodes = self.__find_nodes(iname, relationship, value)
+        return postings.union(*[self.__node_references(node, ordered = True) for node in nodes])
 
-    # selection: a query in the same format required by find()
+    #
+    # The number of references an operation of find_nested would return,
+    # read from the subtree sizes of the index. Returns None if the tree was
+    # not built with them.
+    #
+    def __estimate(self, iname, relationship, value):
+        root = self.__get_root(iname)
+        if root is None:
+            return 0
+        if "size" not in root:
+            return None
+        if relationship == self.RANGE_OP:
+            return self.count_range(iname, value)
+        return self.count(iname, relationship, value)
+
+    #
+    # Checks an operation of find_nested against the ORE ciphertexts stored
+    # in the candidate documents, without walking the index.
+    #
+    # Returns the candidates that satisfy it, or None if some candidate was
+    # stored without its index ciphertext.
+    #
+    def __filter(self, candidates, iname, relationship, value):
+        compare_many = self.__ciphers["references"].compare_many
+        if relationship == self.RANGE_OP:
+            ctLs = value
+            # start <= x and end >= x
+            accept = lambda r: r[0] in (0, -1) and r[1] in (0, 1)
+        else:
+            ctLs = [value]
+            # find() returns the values x for which compare(ctL, x) is the
+            # relationship
+            accept = lambda r: r[0] == relationship
+
+        result = set()
+        candidates = list(candidates)
+        batch_size = SecMongoCursor.DEFAULT_BATCH_SIZE
+        for i in range(0, len(candidates), batch_size):
+            ids = []
+            ctRs = []
+            for doc in self.collection.find(
+                {"_id": {"$in": candidates[i:i+batch_size]}},
+                projection = [iname + ".index"]
+            ):
+                try:
+                    ctRs.append(doc[iname]["index"][1])
+                except (KeyError, IndexError, TypeError):
+                    return None
+                ids.append(doc["_id"])
+            outcomes = zip(*[compare_many(ctL, ctRs) for ctL in ctLs])
+            result.update([_id for _id, r in zip(ids, outcomes) if accept(r)])
+        return result
+
+    # selection: a query in the same format required by find(). A dict is
+    #            taken as its keyword arguments, e.g.
+    #            {"index": ctL, "relationship": 0, "iname": "age"}
     # diff: A single dict in the format:
     #     {operation:{field1:Enc(value1),field2:Enc((value2),...}}
+    #
+    # Returns the number of documents modified.
     def update(self, selection, diff):
         # Select and update a set of entries
         operation = diff.keys()[0]
-        output = []
-        s = self.find(selection, projection=["_id"] + diff[operation].keys())
+        modified = 0
+        projection = ["_id"] + diff[operation].keys()
+        if isinstance(selection, dict):
+            s = self.find(projection = projection, **selection)
+        else:
+            s = self.find(selection, projection = projection)
 
         if operation in ["$inc", "$dec"]:
             field_kind = "h_add"
 
             cipher = self.__ciphers[field_kind]
-            for document in s:
-                for attribute in diff[operation]:
-                    A = diff[operation][attribute]
-                    B = document[attribute]
-
-                    result = cipher.h_operation(A, B)
-
-                    output.append(self.collection.update(
-                        {"_id": document["_id"]},
-                        {"$set": {attribute: result}})
-                    )
+            mod = cipher.get_public_key()["n2"]
+            # The new ciphertexts of each document are set by a single
+            # operation and the operations are sent in unordered bulk writes
+            # of BULK_SIZE, instead of one round trip per document.
+            # Ciphertexts are stored as the decimal strings returned by
+            # Paillier.encrypt. Attributes may be dotted paths, such as
+            # "rating.h_add".
+            increments = dict((attribute, long(A)) for attribute, A in diff[operation].items())
+            requests = (UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": dict(
+                    (attribute, str(cipher.h_operation(
+                        A,
+                        long(reduce(lambda d, key: d[key], attribute.split("."), document)),
+                        mod = mod
+                    )))
+                    for attribute, A in increments.items()
+                )}
+            ) for document in s)
+            for c in self.__chunks(requests, size = self.BULK_SIZE):
+                modified = modified + self.collection.bulk_write(list(c), ordered = False).modified_count
         elif operation == "$set":
-            output = [self.collection.update({"_id": x["_id"]},
-                                             diff) for x in s]
+            for x in s:
+                modified = modified + self.collection.update_one({"_id": x["_id"]}, diff).modified_count
+            # The index trees over the updated attributes are not rebuilt and
+            # keep pointing to the old values until the caller rebuilds them.
+            # Only their cached nodes are dropped.
+            for attribute in diff[operation]:
+                self.node_cache.invalidate_iname(attribute)
         else:
             raise ValueError()
 
-        return output
+        return modified
+
+    #
+    # Adds up the Paillier ciphertexts stored in field (e.g. "rating.h_add")
+    # by the documents that satisfy query, a sequence of operations in the
+    # format of find_nested. The server multiplies the ciphertexts with a
+    # $accumulator, so only their product is sent back. This needs MongoDB
+    # 4.4+, server-side JavaScript and a JavaScript engine with BigInt, which
+    # the mozjs shipped with 4.4 and 5.0 lacks. Once the aggregation fails for
+    # any of these reasons SERVER_AGGREGATION is cleared and it is not tried
+    # again. The ciphertexts are then read with a plain find and multiplied
+    # here as they arrive.
+    # Packed fields (e.g. "ratings.h_add_packed") are added up slot by slot.
+    #
+    # Returns a tuple (Enc(sum), number of documents added up)
+    #
+    def aggregate_sum(self, query, field):
+        n2 = self.__ciphers["h_add"].get_public_key()["n2"]
+        ids = self.find_nested(query, return_ids = True)
+
+        product = 1
+        count = 0
+        for c in self.__chunks(ids, size = self.AGGREGATE_SIZE):
+            selection = {"_id": {"$in": list(c)}, field: {"$exists": True}}
+            if self.SERVER_AGGREGATION:
+                try:
+                    c_product, c_count = self.__aggregate_product(selection, field, n2)
+                except (OperationFailure, NotImplementedError):
+                    # mongomock raises NotImplementedError
+                    warnings.warn("$accumulator is not available. Aggregating locally.")
+                    self.SERVER_AGGREGATION = False
+            if not self.SERVER_AGGREGATION:
+                c_product, c_count = self.__local_product(selection, field, n2)
+            product = product * c_product % n2
+            count = count + c_count
+        return product, count
+
+    #
+    # The product of the ciphertexts in field, computed by the server
+    #
+    def __aggregate_product(self, selection, field, n2):
+        if self.__accumulator_scripts is None:
+            script_dir = os.path.join(os.path.dirname(__file__), "scripts", "accumulators")
+            scripts = {}
+            for stage in ("init", "accumulate", "merge", "finalize"):
+                with open(os.path.join(script_dir, "paillier_product_%s.js" % stage), "r") as js_file:
+                    scripts[stage] = "".join(js_file.readlines())
+            SecMongo.__accumulator_scripts = scripts
+        scripts = self.__accumulator_scripts
+
+        result = list(self.collection.aggregate([
+            {"$match": selection},
+            {"$group": {
+                "_id": None,
+                "product": {"$accumulator": {
+                    "init": scripts["init"],
+                    "initArgs": [str(n2)],
+                    "accumulate": scripts["accumulate"],
+                    "accumulateArgs": ["$" + field],
+                    "merge": scripts["merge"],
+                    "finalize": scripts["finalize"],
+                    "lang": "js"
+                }},
+                "count": {"$sum": 1}
+            }}
+        ]))
+        if len(result) == 0:
+            return 1, 0
+        return long(result[0]["product"]), result[0]["count"]
+
+    #
+    # The product of the ciphertexts in field, computed as they are read
+    #
+    def __local_product(self, selection, field, n2):
+        mpz = self.__ciphers["h_add"].backend.mpz
+        product = mpz(1)
+        count = 0
+        for doc in self.collection.find(selection, projection = [field]):
+            for key in field.split("."):
+                doc = doc[key]
+            product = product * mpz(doc) % n2
+            count = count + 1
+        return long(product), count
 
     def insert(self, doc):
         return self.collection.insert(doc)
@@ -337,9 +794,9 @@ class SecMongo:
             node = self.index_collection.find_one({"root": "1"})
             print("Root Index: ", node["index"])
         if(node["right"]):
-            print(" " * spaces, "right", self.print_index(self.index_collection.find_one({"iname_id": node["right"]}), spaces=spaces+4))
+            print(" " * spaces, "right", self.print_index(self.index_collection.find_one({"iname_id": node["right"], "iname": node["iname"]}), spaces=spaces+4))
         if(node["left"]):
-            print(" " * spaces, "left", self.print_index(self.index_collection.find_one({"iname_id": node["left"]}), spaces=spaces+4))
+            print(" " * spaces, "left", self.print_index(self.index_collection.find_one({"iname_id": node["left"], "iname": node["iname"]}), spaces=spaces+4))
         return node["index"]
 
     #
@@ -353,20 +810,36 @@ class SecMongo:
         # We use the index_ctL to look for the position in the index to add a
         # pointer to inserted_index
 
+        index_ctR = self.__binary(index_ctR)
+        if not self.__has_indexes:
+            self.__ensure_indexes()
+
         # Gets the root node
-        node = self.index_collection.find_one({"parent": None, "iname": iname})
+        node = self.__get_root(iname)
         leaf_id = self.index_collection.count()
         if not node:
             # There is no root. The index tree is empty.
             return self.index_collection.insert_one({
+                "iname_id": leaf_id,
                 "references": [inserted_index],
                 "ctR": index_ctR,
                 "parent": None,
                 "left": None,
                 "right": None,
                 "iname": iname, 
-                "height": 1
+                "height": 1,
+                "rank": 0,
+                "count": 1,
+                "size": 1
             })
+        # The closest nodes lower and greater than the index seen so far.
+        # The new node goes between them in order.
+        lower = None
+        greater = None
+        # Subtree sizes are kept only in trees built with them
+        counted = "size" in node
+        # The iname_id of every node above the current one
+        path = []
         # Looks for a leaf to become parent of this index
         while node is not None:
             ctR = node["ctR"]# Given a node, compares to the target
@@ -375,10 +848,22 @@ class SecMongo:
             if r == 0:
                 # The node already exists in the tree
                 # Adds the pointed value to the "references" set
-                self.index_collection.update(
-                    {"iname_id": node["iname_id"]},
-                    {"$addToSet": {"references": inserted_index}}
+                #
+                # The $ne below only sees the uncompressed references, so the
+                # compressed ones are checked here
+                if "postings" in node and inserted_index in self.__node_references(node):
+                    return node
+                update = {"$push": {"references": inserted_index}}
+                if counted:
+                    update["$inc"] = {"count": 1, "size": 1}
+                result = self.index_collection.update_one(
+                    {"iname_id": node["iname_id"], "iname": iname,
+                     "references": {"$ne": inserted_index}},
+                    update
                 )
+                self.node_cache.invalidate(iname, node["iname_id"])
+                if counted and result.modified_count == 1:
+                    self.__inc_size(iname, path)
                 return node
                 
             elif r == 1:
@@ -395,18 +880,24 @@ class SecMongo:
                         "left": None,
                         "right": None,
                         "iname": iname, 
-                        "height": 1
+                        "height": 1,
+                        "rank": self.__rank_between(iname, node, greater),
+                        "count": 1,
+                        "size": 1
                     })
                     self.index_collection.update(
-                        {"iname_id": node["iname_id"]},
+                        {"iname_id": node["iname_id"], "iname": iname},
                         {"$set": {"right": leaf_id}}
                     )
+                    self.node_cache.invalidate(iname, node["iname_id"])
+                    if counted:
+                        self.__inc_size(iname, path + [node["iname_id"]])
                     break
                 else:
                     # There is a node on the right.
-                    node = self.index_collection.find_one(
-                        {"iname_id": node["right"], "iname": iname}
-                    )
+                    lower = node
+                    path.append(node["iname_id"])
+                    node, = self.__fetch_nodes(iname, [node["right"]])
             elif r == -1:
                 # index is lower than this node.
                 if node["left"] is None:
@@ -420,24 +911,72 @@ class SecMongo:
                         "left": None,
                         "right": None,
                         "iname": iname, 
-                        "height": node["height"] + 1
+                        "height": node["height"] + 1,
+                        "rank": self.__rank_between(iname, lower, node),
+                        "count": 1,
+                        "size": 1
                     })
                     self.index_collection.update(
-                        {"iname_id": node["iname_id"]},
+                        {"iname_id": node["iname_id"], "iname": iname},
                         {"$set": {"left": leaf_id}}
                     )
+                    self.node_cache.invalidate(iname, node["iname_id"])
+                    if counted:
+                        self.__inc_size(iname, path + [node["iname_id"]])
                     break
                 else:
-                    node = self.index_collection.find_one(
-                        {"iname_id": node["left"], "iname": iname}
-                    )
+                    greater = node
+                    path.append(node["iname_id"])
+                    node, = self.__fetch_nodes(iname, [node["left"]])
         # self.run_scripts()
         return new
     
+    #
+    # Picks the rank of a node inserted between lower and greater, which may
+    # be None at the ends of the tree. If there is no gap left between them,
+    # every rank from greater on is shifted by RANK_GAP.
+    #
+    # Returns None if the tree was not built with ranks.
+    #
+    def __rank_between(self, iname, lower, greater):
+        if any(x is not None and x.get("rank") is None for x in (lower, greater)):
+            return None
+        if greater is None:
+            return lower["rank"] + self.RANK_GAP
+        if lower is None:
+            return greater["rank"] - self.RANK_GAP
+        if greater["rank"] - lower["rank"] < 2:
+            self.index_collection.update_many(
+                {"iname": iname, "rank": {"$gte": greater["rank"]}},
+                {"$inc": {"rank": self.RANK_GAP}}
+            )
+            self.node_cache.invalidate_iname(iname)
+            return (lower["rank"] + greater["rank"] + self.RANK_GAP)/2
+        return (lower["rank"] + greater["rank"])/2
+
+    #
+    # Adds a reference to the subtree size of each node in iname_ids
+    #
+    def __inc_size(self, iname, iname_ids):
+        if len(iname_ids) == 0:
+            return
+        self.index_collection.update_many(
+            {"iname_id": {"$in": iname_ids}, "iname": iname},
+            {"$inc": {"size": 1}}
+        )
+        for iname_id in iname_ids:
+            self.node_cache.invalidate(iname, iname_id)
+
     # 
     # build the index for a collection of encrypted documents on memory
     # returns the index as a list
     # 
+    # The nodes built here, and the mem_* rotations, carry no rank, count or
+    # size. On such a tree count() and count_range() walk the index,
+    # find_range() compares every node in the range and find_nested() runs
+    # its operations in the given order. Only the ordered builders support
+    # counting.
+    #
     def mem_build_index(self, enc_docs, iname):
         icollection = []
 
@@ -543,8 +1082,8 @@ class SecMongo:
 
         print "Will sort enc_docs"
         start = time.time()
-        # import pdb;pdb.set_trace()
-        enc_docs.sort(cmp = lambda x, y: self.__ciphers["references"].compare(x[iname]["index"][0],y[iname]["index"][1]))
+        order = self.__ciphers["references"].argsort([x[iname]["index"] for x in enc_docs])
+        enc_docs[:] = [enc_docs[i] for i in order]
         end = time.time()
         print "Done in %ds (%f doc/s)" % (end - start, len(enc_docs)/float(end-start))
 
@@ -588,50 +1127,15 @@ class SecMongo:
                 "left": None,
                 "right": None,
                 "iname": iname, 
-                "height": height + 1
+                "height": height + 1,
+                "rank": L*self.RANK_GAP,
+                "count": len(inserted_indexes),
+                "size": len(inserted_indexes)
             })
             return iname_id
-        elif (L-R) == 1:
-            #   if(L+1 == R) {
-            #     Node *left = Node_new(key[L], value[L]);
-            #     Node *right = Node_new(key[R], value[R]);
-            #     left->tree.avl_right = right;
-            #     left->tree.avl_height = 1;
-            #     return left;
-            #   }
-            left = enc_docs[0]
-            right = enc_docs[1]
-
-            index_left_ctR = left[iname]["index"][1]
-            index_right_ctR = right[iname]["index"][1]
-
-            inserted_left_index = left[iname]["inserted_indexes"]
-            inserted_right_index = right[iname]["inserted_indexes"]
-
-            right_iname_id = len(icollection)
-            icollection.append({
-                "iname_id": right_iname_id,
-                "references": inserted_right_index,
-                "ctR": index_right_ctR,
-                "parent": None,
-                "left": None,
-                "right": None,
-                "iname": iname, 
-                "height": height+2
-            })
-            left_iname_id = len(icollection)
-            icollection.append({
-                "iname_id": left_iname_id,
-                "references": inserted_left_index,
-                "ctR": index_left_ctR,
-                "parent": parent_iname_id,
-                "left": None,
-                "right": right_iname_id,
-                "iname": iname, 
-                "height": height+1
-            })
-            icollection[-2]["parent"] = left_iname_id
-            return left_iname_id
+        elif L > R:
+            # Empty range
+            return None
         else:
             #   // more than two nodes
             #   M = L + (R-L)/2;
@@ -659,7 +1163,9 @@ class SecMongo:
                     "left": None,
                     "right": None,
                     "iname": iname, 
-                    "height": height+1
+                    "height": height+1,
+                    "rank": M_id*self.RANK_GAP,
+                    "count": len(inserted_indexes)
                 }
             icollection.append(middle)
 
@@ -689,6 +1195,9 @@ class SecMongo:
             # left_height = self.__mem_get_tree_height(icollection, middle["left"])["height"]
             # right_height = self.__mem_get_tree_height(icollection, middle["right"])["height"]
             middle["height"] = 1 + max(left_height, right_height)
+            middle["size"] = middle["count"] + sum(
+                [icollection[x]["size"] for x in (left_iname_id, right_iname_id) if x is not None]
+            )
 
             return middle_iname_id
 
@@ -705,6 +1214,20 @@ class SecMongo:
         end = time.time()
         print "[%s] - Done in %ds (%f doc/s)" % (iname, end - start, len(docs)/float(end-start))
 
+        grouped_docs = self.__mem_group_docs(docs, iname)
+        icollection = []
+        start = time.time()
+        self.__mem_ordered_build_index_aux(icollection, grouped_docs, 0, len(grouped_docs)-1, iname, client)
+        end = time.time()
+        print "[%s] - Done in %ds (%f doc/s)" % (iname, end - start, len(docs)/float(end-start))
+        return icollection
+
+    #
+    # Groups documents sorted by iname that share the same value. Each group
+    # is a copy of its first document plus the list of _ids of the group in
+    # "inserted_indexes".
+    #
+    def __mem_group_docs(self, docs, iname):
         print "[%s] - Will group docs." % iname
         start = time.time()
         grouped_docs = []
@@ -725,12 +1248,7 @@ class SecMongo:
         end = time.time()
         print "[%s] - Done in %ds (%f doc/s)" % (iname, end - start, len(docs)/float(end-start))
         print "[%s] - grouped_docs: %d" % (iname, len(grouped_docs))
-        icollection = []
-        start = time.time()
-        self.__mem_ordered_build_index_aux(icollection, grouped_docs, 0, len(grouped_docs)-1, iname, client)
-        end = time.time()
-        print "[%s] - Done in %ds (%f doc/s)" % (iname, end - start, len(docs)/float(end-start))
-        return icollection
+        return grouped_docs
 
     # L and R are indexes in enc_docs
     def __mem_ordered_build_index_aux(self, icollection, docs, L, R, iname, client, height = 1, parent_iname_id = None):
@@ -750,50 +1268,15 @@ class SecMongo:
                 "left": None,
                 "right": None,
                 "iname": iname, 
-                "height": height + 1
+                "height": height + 1,
+                "rank": L*self.RANK_GAP,
+                "count": len(inserted_indexes),
+                "size": len(inserted_indexes)
             })
             return iname_id
-        elif (L-R) == 1:
-            #   if(L+1 == R) {
-            #     Node *left = Node_new(key[L], value[L]);
-            #     Node *right = Node_new(key[R], value[R]);
-            #     left->tree.avl_right = right;
-            #     left->tree.avl_height = 1;
-            #     return left;
-            #   }
-            left = docs[0]
-            right = docs[1]
-
-            index_left_ctR = client.get_ctR(left[iname])
-            index_right_ctR = client.get_ctR(right[iname])
-
-            inserted_left_index = left["inserted_indexes"]
-            inserted_right_index = right["inserted_indexes"]
-
-            right_iname_id = len(icollection)
-            icollection.append({
-                "iname_id": right_iname_id,
-                "references": inserted_right_index,
-                "ctR": index_right_ctR,
-                "parent": None,
-                "left": None,
-                "right": None,
-                "iname": iname, 
-                "height": height+2
-            })
-            left_iname_id = len(icollection)
-            icollection.append({
-                "iname_id": left_iname_id,
-                "references": inserted_left_index,
-                "ctR": index_left_ctR,
-                "parent": parent_iname_id,
-                "left": None,
-                "right": right_iname_id,
-                "iname": iname, 
-                "height": height+1
-            })
-            icollection[-2]["parent"] = left_iname_id
-            return left_iname_id
+        elif L > R:
+            # Empty range
+            return None
         else:
             #   // more than two nodes
             #   M = L + (R-L)/2;
@@ -821,7 +1304,9 @@ class SecMongo:
                     "left": None,
                     "right": None,
                     "iname": iname, 
-                    "height": height+1
+                    "height": height+1,
+                    "rank": M_id*self.RANK_GAP,
+                    "count": len(inserted_indexes)
                 }
             icollection.append(middle)
 
@@ -853,6 +1338,9 @@ class SecMongo:
             # left_height = self.__mem_get_tree_height(icollection, middle["left"])["height"]
             # right_height = self.__mem_get_tree_height(icollection, middle["right"])["height"]
             middle["height"] = 1 + max(left_height, right_height)
+            middle["size"] = middle["count"] + sum(
+                [icollection[x]["size"] for x in (left_iname_id, right_iname_id) if x is not None]
+            )
 
             return middle_iname_id
     
@@ -862,9 +1350,252 @@ class SecMongo:
             yield chain([first], islice(iterator, size - 1))
     #
     # Receives an index built on memory and inserts in the DB
-    def insert_mem_tree(self, iname_index):
+    #
+    # compress: store the references of each node as compressed blocks of
+    #           sorted _ids (see index/postings.py). Nodes that reference
+    #           anything other than non-negative integers are kept as they are.
+    def insert_mem_tree(self, iname_index, compress = False):
+        if not self.__has_indexes:
+            self.__ensure_indexes()
+        overflow = []
+        for node in iname_index:
+            node["ctR"] = self.__binary(node["ctR"])
+            if compress:
+                overflow.extend(self.__compress_references(node))
         for c in self.__chunks(iname_index):
             self.index_collection.insert_many(c, ordered = False, bypass_document_validation = True)
+        for c in self.__chunks(overflow, size = 100):
+            self.postings_collection.insert_many(c, ordered = False, bypass_document_validation = True)
+
+    #
+    # Moves the references of a node to its "postings" field. If the blocks
+    # add up to more than POSTINGS_INLINE_SIZE bytes they are returned as
+    # documents for postings_<collection> and the node only keeps their
+    # number, in "overflow".
+    #
+    def __compress_references(self, node):
+        if not postings.compressible(node["references"]):
+            return []
+        blocks = [Binary(x) for x in postings.encode(node["references"])]
+        node["references"] = []
+        if sum(len(x) for x in blocks) <= self.POSTINGS_INLINE_SIZE:
+            node["postings"] = blocks
+            return []
+        node["postings"] = []
+        node["overflow"] = len(blocks)
+        return [{
+            "iname": node["iname"],
+            "iname_id": node["iname_id"],
+            "block": i,
+            "data": block
+            } for i, block in enumerate(blocks)]
+
+    #
+    # ORE ciphertexts are bytes and are stored as BSON BinData. Ciphertexts
+    # in the legacy format (lists of ints) are kept as they are.
+    #
+    @staticmethod
+    def __binary(ct):
+        if isinstance(ct, bytes) and not isinstance(ct, Binary):
+            return Binary(ct)
+        return ct
+
+    #
+    # B+tree index
+    #
+    # An alternative to the binary tree of references_<collection>. Each page
+    # is a document of pages_<collection> with up to PAGE_FANOUT sorted ctRs,
+    # so a lookup costs one round trip per level and a compare is done in a
+    # single batch per page.
+    #
+    # Leaf pages (level 0) hold the references of each ctR. They are numbered
+    # 0, 1, 2, ... in ascending order, so any run of leaves is read with a
+    # single query. Inner pages hold the page_ids of their children and, as
+    # separators, the smallest ctR below each child but the first.
+    #
+
+    #
+    # Builds a B+tree for a collection of plaintext documents on memory
+    # returns the pages as a list
+    #
+    def mem_ordered_build_pages(self, docs, iname, client, fanout = None):
+        fanout = fanout or self.PAGE_FANOUT
+        assert fanout > 1
+
+        print "[%s] - Will sort docs" % iname
+        start = time.time()
+        docs.sort(key = lambda x: x[iname])
+        end = time.time()
+        print "[%s] - Done in %ds (%f doc/s)" % (iname, end - start, len(docs)/float(end-start))
+
+        grouped_docs = self.__mem_group_docs(docs, iname)
+
+        print "[%s] - Will build pages." % iname
+        start = time.time()
+        pages = []
+        # (page_id, smallest ctR) of each page in the level being built
+        level = []
+        for i in range(0, len(grouped_docs), fanout):
+            chunk = grouped_docs[i:i+fanout]
+            ctRs = [self.__binary(client.get_ctR(doc[iname])) for doc in chunk]
+            pages.append({
+                "page_id": len(pages),
+                "iname": iname,
+                "level": 0,
+                "root": False,
+                "ctRs": ctRs,
+                "references": [doc["inserted_indexes"] for doc in chunk]
+            })
+            level.append((pages[-1]["page_id"], ctRs[0]))
+
+        height = 0
+        while len(level) > 1:
+            height = height + 1
+            upper_level = []
+            for i in range(0, len(level), fanout):
+                chunk = level[i:i+fanout]
+                pages.append({
+                    "page_id": len(pages),
+                    "iname": iname,
+                    "level": height,
+                    "root": False,
+                    "ctRs": [ctR for _, ctR in chunk[1:]],
+                    "children": [page_id for page_id, _ in chunk]
+                })
+                upper_level.append((pages[-1]["page_id"], chunk[0][1]))
+            level = upper_level
+
+        if len(pages) > 0:
+            pages[-1]["root"] = True
+        end = time.time()
+        print "[%s] - Done in %ds (%d pages, %d levels)" % (iname, end - start, len(pages), height + 1)
+        return pages
+
+    #
+    # Receives a B+tree built on memory and inserts in the DB
+    def insert_mem_pages(self, pages):
+        if not self.__has_indexes:
+            self.__ensure_indexes()
+        for c in self.__chunks(pages, size=100):
+            self.page_collection.insert_many(c, ordered = False, bypass_document_validation = True)
+
+    # Executes a single lookup operation on a B+tree index. Accepts the same
+    # relationships as find().
+    #
+    # return_ids: Return a list with ids, if True. Else, return a
+    #             SecMongoCursor.
+    def find_pages(self,
+            index = None,
+            relationship = 0,
+            projection = None,
+            iname = None,
+            return_ids = False):
+
+        if index is None:
+            return self.collection.find()
+
+        ctL = index
+        ore = self.__ciphers["references"]
+
+        def references():
+            leaf, = self.__descend_pages(iname, [ctL])
+            if leaf is None:
+                return
+            if relationship == 0: # Equality
+                i = ore.lower_bound(ctL, leaf["ctRs"])
+                if i < len(leaf["ctRs"]) and ore.compare(ctL, leaf["ctRs"][i]) == 0:
+                    yield leaf["references"][i]
+            elif relationship == 1: # > than
+                # Every value lower than ctL
+                i = ore.lower_bound(ctL, leaf["ctRs"])
+                for references in leaf["references"][:i]:
+                    yield references
+                for references in self.__fetch_leaves(iname, {"$lt": leaf["page_id"]}):
+                    yield references
+            else: # < than
+                assert relationship == -1
+                # Every value greater than ctL
+                i = ore.upper_bound(ctL, leaf["ctRs"])
+                for references in leaf["references"][i:]:
+                    yield references
+                for references in self.__fetch_leaves(iname, {"$gt": leaf["page_id"]}):
+                    yield references
+        return self.__results(references, projection, return_ids)
+
+    # Executes a range lookup, with both ends included, on a B+tree index.
+    #
+    # return_ids: Return a list with ids, if True. Else, return a
+    #             SecMongoCursor.
+    def find_range_pages(self,
+            index = None,
+            projection = None,
+            iname = None,
+            return_ids = False):
+
+        if index is None:
+            return self.collection.find()
+        else:
+            assert type(index) in (list, tuple) and len(index) == 2
+
+        start_ctL, end_ctL = index
+        ore = self.__ciphers["references"]
+
+        def references():
+            start_leaf, end_leaf = self.__descend_pages(iname, [start_ctL, end_ctL])
+            if start_leaf is None:
+                return
+            i = ore.lower_bound(start_ctL, start_leaf["ctRs"])
+            j = ore.upper_bound(end_ctL, end_leaf["ctRs"])
+            if start_leaf["page_id"] == end_leaf["page_id"]:
+                leaves = [start_leaf["references"][i:j]]
+            elif start_leaf["page_id"] < end_leaf["page_id"]:
+                leaves = [
+                    start_leaf["references"][i:],
+                    self.__fetch_leaves(iname, {"$gt": start_leaf["page_id"], "$lt": end_leaf["page_id"]}),
+                    end_leaf["references"][:j]
+                ]
+            else:
+                leaves = []
+            for references in chain(*leaves):
+                yield references
+        return self.__results(references, projection, return_ids)
+
+    #
+    # Descends the B+tree of iname looking for each ctL. All ctLs go down
+    # together, so each level costs a single round trip to the database.
+    #
+    # Returns the leaf page that may hold each ctL, or None for each of them
+    # if the tree is empty.
+    #
+    def __descend_pages(self, iname, ctLs):
+        upper_bound = self.__ciphers["references"].upper_bound
+
+        root = self.page_collection.find_one({"iname": iname, "root": True})
+        if root is None:
+            return [None] * len(ctLs)
+
+        pages = [root] * len(ctLs)
+        while pages[0]["level"] > 0:
+            # The child that holds ctL is the one after the last separator
+            # not greater than ctL
+            children = [page["children"][upper_bound(ctL, page["ctRs"])] for ctL, page in zip(ctLs, pages)]
+            fetched = dict((page["page_id"], page) for page in self.page_collection.find(
+                {"iname": iname, "page_id": {"$in": list(set(children))}}
+            ))
+            pages = [fetched[page_id] for page_id in children]
+        return pages
+
+    #
+    # Fetches the references of every leaf whose page_id satisfies the
+    # condition page_ids with a single query.
+    #
+    def __fetch_leaves(self, iname, page_ids):
+        for page in self.page_collection.find(
+            {"iname": iname, "page_id": page_ids, "level": 0},
+            projection = ["references"]
+        ):
+            for references in page["references"]:
+                yield references
 
     def run_scripts(self, new):
         if isinstance(new, pymongo.results.InsertOneResult):
@@ -880,48 +1611,50 @@ class SecMongo:
             self.db.system_js.rebalance_avl(self.index_collection.name,
                                             new["_id"])
             # self.balance_node(self.index_collection.find_one({"parent": None}))
+        # The scripts move nodes on the server, so cached nodes are stale
+        self.node_cache.clear()
 
     def balance_node(self, node):
         if node:
-            left = self.index_collection.find_one({"iname_id": node["left"]})
+            left = self.index_collection.find_one({"iname_id": node["left"], "iname": node["iname"]})
             left_balance, left_height = self.balance_node(left)
 
-            right = self.index_collection.find_one({"iname_id": node["right"]})
+            right = self.index_collection.find_one({"iname_id": node["right"], "iname": node["iname"]})
             right_balance, right_height = self.balance_node(right)
 
             node = self.index_collection.find_one(
-                {"iname_id": node["iname_id"]}
+                {"iname_id": node["iname_id"], "iname": node["iname"]}
             )
-            left = self.index_collection.find_one({"iname_id": node["left"]})
-            right = self.index_collection.find_one({"iname_id": node["right"]})
+            left = self.index_collection.find_one({"iname_id": node["left"], "iname": node["iname"]})
+            right = self.index_collection.find_one({"iname_id": node["right"], "iname": node["iname"]})
 
             local_balance = (right_height - left_height)
             if local_balance not in [-1, 0, 1]:
                 print("unbalance")
                 if local_balance > 0:
                     parent = self.index_collection.find_one(
-                        {"iname_id": right["iname_id"]}
+                        {"iname_id": right["iname_id"], "iname": node["iname"]}
                     )
                     if right_balance < 0:
                         self.right_rotate(right)
                         node = self.index_collection.find_one(
-                            {"iname_id": node["iname_id"]}
+                            {"iname_id": node["iname_id"], "iname": node["iname"]}
                         )
                         parent = self.index_collection.find_one(
-                            {"iname_id": right["left"]}
+                            {"iname_id": right["left"], "iname": node["iname"]}
                         )
                     self.left_rotate(node)
                 elif local_balance < 0:
                     parent = self.index_collection.find_one(
-                        {"iname_id": left["iname_id"]}
+                        {"iname_id": left["iname_id"], "iname": node["iname"]}
                     )
                     if left_balance > 0:
                         self.left_rotate(left)
                         node = self.index_collection.find_one(
-                            {"iname_id": node["iname_id"]}
+                            {"iname_id": node["iname_id"], "iname": node["iname"]}
                         )
                         parent = self.index_collection.find_one(
-                            {"iname_id": left["right"]}
+                            {"iname_id": left["right"], "iname": node["iname"]}
                         )
                     self.right_rotate(node)
                 return self.balance_node(parent)
@@ -930,75 +1663,105 @@ class SecMongo:
         else:
             return 0, 0
 
+    #
+    # Rotations link nodes by iname_id, as the rest of the tree does, and
+    # keep their subtree sizes. Their ranks do not change, since a rotation
+    # keeps the order of the nodes.
+    #
     def right_rotate(self, node):
-        left = self.index_collection.find_one({"iname_id": node["left"]})
+        iname = node["iname"]
+        # Rotations move several nodes and possibly the root
+        self.node_cache.invalidate_iname(iname)
+        left = self.index_collection.find_one({"iname_id": node["left"], "iname": iname})
         # Set original left child"s right child parent to node.
-        if(left["right"]):
+        if left["right"] is not None:
             self.index_collection.update(
-                {"_id": left["right"]},
-                {"$set": {"parent": node["_id"]}}
+                {"iname_id": left["right"], "iname": iname},
+                {"$set": {"parent": node["iname_id"]}}
             )
         # Set original parent child to left child of node.
-        if(node["parent"]):
-            parent = self.index_collection.find_one({"iname_id": node["parent"]})
-            side = "left" if parent["left"] == node["_id"] else "right"
+        if node["parent"] is not None:
+            parent = self.index_collection.find_one({"iname_id": node["parent"], "iname": iname})
+            side = "left" if parent["left"] == node["iname_id"] else "right"
             if side == "left":
                 self.index_collection.update(
-                    {"_id": parent["_id"]},
-                    {"$set": {"left": left["_id"]}}
+                    {"iname_id": parent["iname_id"], "iname": iname},
+                    {"$set": {"left": left["iname_id"]}}
                 )
             elif side == "right":
                 self.index_collection.update(
-                    {"_id": parent["_id"]},
-                    {"$set": {"right": left["_id"]}}
+                    {"iname_id": parent["iname_id"], "iname": iname},
+                    {"$set": {"right": left["iname_id"]}}
                 )
+        left_set = {"parent": node["parent"], "right": node["iname_id"]}
+        node_set = {"left": left["right"], "parent": left["iname_id"]}
+        self.__rotate_sizes(node, left, left["right"], node_set, left_set)
         # Set orginal left"s parent to node"s original parent.
         self.index_collection.update(
-            {"_id": left["_id"]},
-            {"$set": {"parent": node["parent"], "right": node["_id"]}}
+            {"iname_id": left["iname_id"], "iname": iname},
+            {"$set": left_set}
         )
         # Set node"s left child to left"s original right child update parent of
         # node to original left child.
         self.index_collection.update(
-            {"_id": node["_id"]},
-            {"$set": {"left": left["right"], "parent": left["_id"]}}
+            {"iname_id": node["iname_id"], "iname": iname},
+            {"$set": node_set}
         )
 
     def left_rotate(self, node):
-        right = self.index_collection.find_one({"iname_id": node["right"]})
+        iname = node["iname"]
+        # Rotations move several nodes and possibly the root
+        self.node_cache.invalidate_iname(iname)
+        right = self.index_collection.find_one({"iname_id": node["right"], "iname": iname})
         # Set original left child"s right child parent to node.
-        if(right["left"]):
+        if right["left"] is not None:
             self.index_collection.update(
-                {"_id": right["left"]},
-                {"$set": {"parent": node["_id"]}}
+                {"iname_id": right["left"], "iname": iname},
+                {"$set": {"parent": node["iname_id"]}}
             )
         # Set original parent child to right child of node.
-        if(node["parent"]):
-            parent = self.index_collection.find_one({"iname_id": node["parent"]})
-            side = "left" if parent["left"] == node["_id"] else "right"
+        if node["parent"] is not None:
+            parent = self.index_collection.find_one({"iname_id": node["parent"], "iname": iname})
+            side = "left" if parent["left"] == node["iname_id"] else "right"
             if side == "left":
                 self.index_collection.update(
-                    {"_id": parent["_id"]},
-                    {"$set": {"left": right["_id"]}}
+                    {"iname_id": parent["iname_id"], "iname": iname},
+                    {"$set": {"left": right["iname_id"]}}
                 )
             elif side == "right":
                 self.index_collection.update(
-                    {"_id": parent["_id"]},
-                    {"$set": {"right": right["_id"]}}
+                    {"iname_id": parent["iname_id"], "iname": iname},
+                    {"$set": {"right": right["iname_id"]}}
                 )
 
+        right_set = {"parent": node["parent"], "left": node["iname_id"]}
+        node_set = {"right": right["left"], "parent": right["iname_id"]}
+        self.__rotate_sizes(node, right, right["left"], node_set, right_set)
         # Set orginal right"s parent to node"s original parent.
         self.index_collection.update(
-            {"_id": right["_id"]},
-            {"$set": {"parent": node["parent"], "left": node["_id"]}}
+            {"iname_id": right["iname_id"], "iname": iname},
+            {"$set": right_set}
         )
         # Set node"s right child to right"s original right child update parent
         # of node to original right child.
         self.index_collection.update(
-            {"_id": node["_id"]},
-            {"$set": {"right": right["left"], "parent": right["_id"]}}
+            {"iname_id": node["iname_id"], "iname": iname},
+            {"$set": node_set}
         )
 
+    #
+    # Subtree sizes after node is rotated down and child takes its place. node
+    # loses child but gains the inner subtree of child, whose id is inner.
+    # The new sizes are added to the $set of each node.
+    #
+    def __rotate_sizes(self, node, child, inner, node_set, child_set):
+        if "size" not in node:
+            return
+        if inner is not None:
+            inner = self.index_collection.find_one({"iname_id": inner, "iname": node["iname"]})
+        child_set["size"] = node["size"]
+        node_set["size"] = node["size"] - child["size"] + (inner["size"] if inner else 0)
+
     def mem_balance_node(self, mem_index, node):
         if node:
             # sanity test
@@ -1145,6 +1908,10 @@ class SecMongo:
     def drop_collection(self):
         self.collection.drop()
         self.index_collection.drop()
+        self.page_collection.drop()
+        self.postings_collection.drop()
+        self.node_cache.clear()
+        self.__has_indexes = False
         return
 
     def __mem_get_node_by_iname_id(self, mem_index, iname_id):
@@ -1244,11 +2011,11 @@ class SecMongo:
         records = []
         if node is not None:
             if projection:
-                records.extend(self.collection.find({"_id": {"$in": node["references"]}}, projection = projection))
-                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["right"]}), projection = projection))
-                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["left"]}), projection = projection))
+                records.extend(self.collection.find({"_id": {"$in": list(self.__node_references(node))}}, projection = projection))
+                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["right"], "iname": node["iname"]}), projection = projection))
+                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["left"], "iname": node["iname"]}), projection = projection))
             else:
-                records.extend(self.collection.find({"_id": {"$in": node["references"]}}))
-                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["right"]})))
-                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["left"]})))
+                records.extend(self.collection.find({"_id": {"$in": list(self.__node_references(node))}}))
+                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["right"], "iname": node["iname"]})))
+                records.extend(self.__get_branch(self.index_collection.find_one({"iname_id": node["left"], "iname": node["iname"]})))
         return records
@@ -9,5 +9,5 @@ setup(name='secmongo',
       license='GPLv3',
       packages=['secmongo', 'secmongo/crypto', 'secmongo/index', 'secmongo/scripts'],
       package_data={'secmongo/crypto': ['*'], 'secmongo/index': ['*'],
-                    'secmongo/scripts': ['*.js']},
+                    'secmongo/scripts': ['*.js', 'accumulators/*.js']},
       zip_safe=False)
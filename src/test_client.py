@@ -3,11 +3,14 @@
 
 from client import Client
 from secmongo import SecMongo
+from bson.binary import Binary
+from pymongo.errors import InvalidOperation
 from bson.json_util import dumps
 from secmongo.index.avltree import AVLTree
 from secmongo.index.encryptednode import EncryptedNode
 import linecache
 import json
+import itertools
 import re
 import time
 
@@ -24,6 +27,21 @@ def parse(docs):
     return docs
 
 
+# The _ids of the documents whose attribute iname satisfies relationship
+# with value, as in SecMongo.find(): 0 selects the equal values, 1 the lower
+# ones and -1 the greater ones
+def expected(docs, iname, relationship, value):
+    if relationship == 0:
+        return set(x["_id"] for x in docs if x[iname] == value)
+    elif relationship == 1:
+        return set(x["_id"] for x in docs if x[iname] < value)
+    return set(x["_id"] for x in docs if x[iname] > value)
+
+# The _ids of the documents whose attribute iname is in [start, end]
+def expected_range(docs, iname, start, end):
+    return set(x["_id"] for x in docs if start <= x[iname] <= end)
+
+
 def main():
     #
     # Input data
@@ -130,6 +148,10 @@ def main():
     # inames will be used to build the indexing
     inames = ["age", "height"]
 
+    # Equal plaintexts must be stored with the same left ciphertext
+    print "Deterministic left ciphertexts:",
+    print client.encrypt({"age": 35})["age"]["index"][0] == client.encrypt({"age": 35})["age"]["index"][0] == Binary(client.get_ctL(35))
+
     # Setup the MongoDB driver
     s = SecMongo(add_cipher_param=pow(client.ciphers["h_add"].keys["pub"]["n"],
                                       2),
@@ -151,6 +173,8 @@ def main():
     for i, _ in enumerate(enc_docs):
         enc_docs[i]["_id"] = i # Add an id
                                # 
+    # The plaintext documents, with the same ids
+    plain_docs = [dict(doc, _id = i) for i, doc in enumerate(docs)]
     # Unload enc_docs to the DB
     start = time.time()
     s.collection.insert_many(
@@ -178,6 +202,9 @@ def main():
 
         del iname_index
 
+        # A B+tree over the same attribute, small enough to have a few levels
+        s.insert_mem_pages(s.mem_ordered_build_pages([dict(x) for x in plain_docs], iname, client, fanout = 3))
+
     diff = time.time() - start
     print "Indexes created for %d docs: %f (%f doc/s)" % (len(inames)*len(indexes_enc_docs), diff, len(indexes_enc_docs)/diff)
 
@@ -238,5 +265,231 @@ def main():
     results.sort()
     print set([x["name"] for x in results]) == set([x["name"] for x in docs if x["height"] < 10 and x["age"] > 30])
 
+    # Values in the documents, between them and beyond both ends
+    probes = {"age": [0, 12, 16, 17, 30, 35, 36, 55, 201, 300],
+              "height": [0, 2, 5, 9, 10, 11, 30, 31]}
+
+    print "Page index lookups:",
+    print all(set(s.find_pages(index = client.get_ctL(v), iname = iname, relationship = r, return_ids = True)) == expected(plain_docs, iname, r, v)
+              for iname in inames for v in probes[iname] for r in (0, 1, -1))
+
+    print "Page index ranges:",
+    print all(set(s.find_range_pages(index = [client.get_ctL(a), client.get_ctL(b)], iname = iname, return_ids = True)) == expected_range(plain_docs, iname, a, b)
+              for iname in inames for a in probes[iname] for b in probes[iname])
+
+    print "Page index documents:",
+    results = parse([client.decrypt(doc) for doc in s.find_pages(index = client.get_ctL(35), iname = "age", relationship = -1)])
+    print sorted(x["name"] for x in results) == sorted(x["name"] for x in docs if x["age"] > 35)
+
+    # The bulk built tree has ranks, so ranges are read by rank
+    print "Range lookups:",
+    print all(sorted(s.find_range(index = [client.get_ctL(a), client.get_ctL(b)], iname = iname, return_ids = True)) == sorted(expected_range(plain_docs, iname, a, b))
+              for iname in inames for a in probes[iname] for b in probes[iname])
+
+    print "Counts:",
+    print all(s.count(iname, r, client.get_ctL(v)) == len(expected(plain_docs, iname, r, v))
+              for iname in inames for v in probes[iname] for r in (0, 1, -1))
+
+    print "Range counts:",
+    print all(s.count_range(iname, [client.get_ctL(a), client.get_ctL(b)]) == len(expected_range(plain_docs, iname, a, b))
+              for iname in inames for a in probes[iname] for b in probes[iname])
+
+    ##############################
+    # Nested lookups
+    #
+    # However find_nested orders the operations, it must return what running
+    # them one by one and intersecting their outcomes does
+
+    plans = [[("age", 0, 35), ("height", -1, 5)],
+             [("age", -1, 16), ("height", 1, 11), ("age", 1, 55)],
+             [("height", s.RANGE_OP, (2, 10)), ("age", s.RANGE_OP, (17, 201))],
+             [("age", 0, 35), ("height", s.RANGE_OP, (0, 31)), ("age", -1, 12)],
+             [("age", -1, 300), ("height", 0, 9)]]
+
+    def encrypt_query(iname, relationship, value):
+        if relationship == s.RANGE_OP:
+            return [iname, relationship, [client.get_ctL(value[0]), client.get_ctL(value[1])]]
+        return [iname, relationship, client.get_ctL(value)]
+
+    def naive(queries):
+        result = None
+        for iname, relationship, value in queries:
+            if relationship == s.RANGE_OP:
+                ids = set(s.find_range(index = value, iname = iname, return_ids = True))
+            else:
+                ids = set(s.find(index = value, iname = iname, relationship = relationship, return_ids = True))
+            result = ids if result is None else result & ids
+        return result
+
+    def plaintext(queries):
+        return set.intersection(*[expected_range(plain_docs, iname, value[0], value[1]) if relationship == s.RANGE_OP
+                                  else expected(plain_docs, iname, relationship, value)
+                                  for iname, relationship, value in queries])
+
+    print "Nested lookups in any order:",
+    print all(set(s.find_nested(list(order), return_ids = True)) == naive(queries) == plaintext(plan)
+              for plan in plans
+              for queries in [[encrypt_query(*q) for q in plan]]
+              for order in itertools.permutations(queries))
+    print "Parallel nested lookups:",
+    print all(set(s.find_nested([encrypt_query(*q) for q in plan], return_ids = True, parallel = True)) == plaintext(plan)
+              for plan in plans)
+    print "Nested lookup documents:",
+    print all(set(doc["_id"] for doc in s.find_nested([encrypt_query(*q) for q in plan], parallel = parallel)) == plaintext(plan)
+              for plan in plans for parallel in (False, True))
+
+    ##############################
+    # Node cache
+    #
+    # Lookups through a cache smaller than the tree give the same results
+
+    print "Node cache:",
+    print s.node_cache.hits > 0 and 0 < s.node_cache.size <= s.node_cache.budget
+    small = SecMongo(add_cipher_param=pow(client.ciphers["h_add"].keys["pub"]["n"], 2), cache_size = 600)
+    small.open_database("test_sec")
+    small.set_collection("gameofthrones")
+    print "Small node cache:",
+    print all(set(small.find(index = client.get_ctL(v), iname = iname, relationship = r, return_ids = True)) == expected(plain_docs, iname, r, v)
+              for iname in inames for v in probes[iname] for r in (0, 1, -1)) and \
+          0 < small.node_cache.size <= 600 and small.node_cache.hits > 0
+
+    ##############################
+    # Cursors
+    #
+    # With batches of a single _id the documents come in the order of the
+    # index walk
+
+    cursor = lambda: s.find(index = client.get_ctL(16), iname = "age", relationship = -1, projection = ["_id"])
+    walk = [x["_id"] for x in cursor().batch_size(1)]
+    print "Cursor:",
+    print sorted(walk) == sorted(expected(plain_docs, "age", -1, 16))
+    print "Cursor batch sizes:",
+    print all(sorted(x["_id"] for x in cursor().batch_size(b)) == sorted(walk) for b in (1, 2, 3, 1000))
+    print "Cursor limit and skip:",
+    print [x["_id"] for x in cursor().batch_size(1).limit(3)] == walk[:3] and \
+          [x["_id"] for x in cursor().batch_size(1).skip(2)] == walk[2:] and \
+          [x["_id"] for x in cursor().batch_size(1).skip(2).limit(3)] == walk[2:5] and \
+          sorted(x["_id"] for x in cursor().batch_size(2).limit(3)) == sorted(walk[:3]) and \
+          len(list(cursor().limit(1000))) == len(walk) and \
+          list(cursor().skip(1000)) == []
+    print "Cursor rewind:",
+    c = cursor().batch_size(2)
+    first = [x["_id"] for x in c]
+    c.rewind()
+    print first == [x["_id"] for x in c] and sorted(first) == sorted(walk)
+    print "Cursor options after the first document:",
+    c = cursor()
+    next(c)
+    try:
+        c.limit(1)
+        print False
+    except InvalidOperation:
+        print True
+
+    ##############################
+    # Counters
+    #
+    # Homomorphic fields are updated without being decrypted
+
+    client.add_attr(name = "rating", attribute = "h_add", domain = range(5))
+    client.add_attr(name = "votes", attribute = "h_add_packed")
+    s.set_collection("gameofthrones_counters")
+    s.drop_collection()
+    counter_docs = [dict(doc, rating = i % 5, votes = [i % 3, 1, i]) for i, doc in enumerate(plain_docs)]
+    s.collection.insert_many([client.encrypt(doc) for doc in counter_docs])
+    for iname in inames:
+        s.insert_mem_tree(s.mem_ordered_build_index([dict(x) for x in counter_docs], iname, client))
+
+    older = expected(counter_docs, "age", -1, 16)
+    print "Updated documents:",
+    print s.update({"index": client.get_ctL(16), "relationship": -1, "iname": "age"},
+                   {"$inc": {"rating.h_add": client.ciphers["h_add"].encrypt(3)}}) == len(older)
+    for doc in counter_docs:
+        if doc["_id"] in older:
+            doc["rating"] = doc["rating"] + 3
+    print "Incremented ratings:",
+    print all(client.decrypt(doc)["rating"]["h_add"] == counter_docs[doc["_id"]]["rating"]
+              for doc in s.collection.find(projection = ["rating"]))
+
+    address = client.encrypt({"address": "Winterfell"})["address"]["static"]
+    print "Set documents:",
+    print s.update({"index": client.get_ctL(35), "relationship": 0, "iname": "age"},
+                   {"$set": {"address.static": address}}) == len(expected(counter_docs, "age", 0, 35))
+    print "Set addresses:",
+    print set(doc["_id"] for doc in s.collection.find({"address.static": address})) == expected(counter_docs, "age", 0, 35)
+
+    # Sums over the documents selected by find_nested, by the server if it
+    # can and then as a server without $accumulator would
+    query = [["age", -1, client.get_ctL(16)], ["height", 1, client.get_ctL(31)]]
+    selected = [doc for doc in counter_docs if doc["_id"] in expected(counter_docs, "age", -1, 16) & expected(counter_docs, "height", 1, 31)]
+    for label in ("Aggregated", "Locally aggregated"):
+        if label == "Locally aggregated":
+            s.SERVER_AGGREGATION = False
+        total, count = s.aggregate_sum(query, "rating.h_add")
+        print "%s ratings:" % label,
+        print client.ciphers["h_add"].decrypt(total) == sum(doc["rating"] for doc in selected) and count == len(selected)
+        total, count = s.aggregate_sum(query, "votes.h_add_packed")
+        print "%s votes:" % label,
+        print client.ciphers["h_add_packed"].decrypt_packed(total, count = 3) == [sum(x) for x in zip(*[doc["votes"] for doc in selected])] and \
+              count == len(selected)
+
+    ##############################
+    # Incremental index
+    #
+    # The same values, indexed one at a time by insert_index. With a small
+    # RANK_GAP the ranks between neighbours run out and are shifted.
+
+    s.set_collection("gameofthrones_incremental")
+    s.drop_collection()
+    s.RANK_GAP = 4
+    extra_docs = [
+        {"_id": 100, "age": 35, "height": 10},
+        {"_id": 101, "age": 36, "height": 11},
+        {"_id": 102, "age": 1, "height": 1},
+        {"_id": 103, "age": 300, "height": 40},
+        {"_id": 104, "age": 35, "height": 20},
+    ]
+    # The first documents are inserted twice. The second time changes nothing.
+    for doc in plain_docs + plain_docs[:3] + extra_docs:
+        for iname in inames:
+            s.insert_index(client.get_ctL(doc[iname]), client.get_ctR(doc[iname]), doc["_id"], iname)
+    all_docs = plain_docs + extra_docs
+
+    def check_incremental(label):
+        print "%s lookups:" % label,
+        print all(sorted(s.find(index = client.get_ctL(v), iname = iname, relationship = r, return_ids = True)) == sorted(expected(all_docs, iname, r, v))
+                  for iname in inames for v in probes[iname] for r in (0, 1, -1))
+        print "%s range lookups:" % label,
+        print all(sorted(s.find_range(index = [client.get_ctL(a), client.get_ctL(b)], iname = iname, return_ids = True)) == sorted(expected_range(all_docs, iname, a, b))
+                  for iname in inames for a in probes[iname] for b in probes[iname])
+        print "%s counts:" % label,
+        print all(s.count(iname, r, client.get_ctL(v)) == len(expected(all_docs, iname, r, v))
+                  for iname in inames for v in probes[iname] for r in (0, 1, -1))
+        print "%s range counts:" % label,
+        print all(s.count_range(iname, [client.get_ctL(a), client.get_ctL(b)]) == len(expected_range(all_docs, iname, a, b))
+                  for iname in inames for a in probes[iname] for b in probes[iname])
+
+    check_incremental("Incremental")
+
+    # Rotate the root down to the left and its old position back to the right
+    for iname in inames:
+        root = s.index_collection.find_one({"iname": iname, "parent": None})
+        s.left_rotate(root)
+        s.right_rotate(s.index_collection.find_one({"iname": iname, "iname_id": root["iname_id"]}))
+    check_incremental("Rotated")
+
+    # A tree built with compressed references. The _ids it already holds are
+    # inserted again and change nothing.
+    s.set_collection("gameofthrones_compressed")
+    s.drop_collection()
+    for iname in inames:
+        s.insert_mem_tree(s.mem_ordered_build_index([dict(x) for x in plain_docs], iname, client), compress = True)
+    for doc in plain_docs + extra_docs + extra_docs[:2]:
+        for iname in inames:
+            s.insert_index(client.get_ctL(doc[iname]), client.get_ctR(doc[iname]), doc["_id"], iname)
+    print "Compressed references:",
+    print s.index_collection.find_one({"postings": {"$exists": True}}) is not None
+    check_incremental("Compressed")
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# coding:  utf-8
+
+from secmongo.index.nodecache import NodeCache
+from bson import BSON
+import random
+
+def node(iname, iname_id, payload = 0):
+    return {"iname": iname, "iname_id": iname_id, "references": range(payload)}
+
+def main():
+    N = 200
+    nodes = [node("age", i, random.randrange(20)) for i in range(N)]
+    sizes = [len(BSON.encode(x)) for x in nodes]
+
+    # Everything fits
+    cache = NodeCache(sum(sizes))
+    for x in nodes:
+        cache.put(x)
+    print "Nodes within the budget are kept:",
+    print len(cache) == N and cache.size == sum(sizes) and all(cache.get("age", i) is nodes[i] for i in range(N))
+
+    # The least recently used nodes are evicted first
+    budget = sum(sizes[:N/2])
+    cache = NodeCache(budget)
+    ok = True
+    for x in nodes:
+        cache.put(x)
+        ok = ok and cache.size <= budget
+    print "Size stays within the budget:",
+    print ok and cache.size == sum(len(BSON.encode(v)) for v in nodes if ("age", v["iname_id"]) in cache)
+    kept = [i for i in range(N) if ("age", i) in cache]
+    print "Least recently used nodes are evicted:",
+    print kept == range(N - len(kept), N) and cache.size + sizes[N - len(kept) - 1] > budget
+
+    # A get moves a node to the most recently used end
+    same = [node("age", i, 5) for i in range(4)]
+    cache = NodeCache(3 * len(BSON.encode(same[0])))
+    for x in same[:3]:
+        cache.put(x)
+    cache.get("age", 0)
+    cache.put(same[3])
+    print "get refreshes a node:",
+    print ("age", 0) in cache and ("age", 1) not in cache
+
+    # Putting a node again replaces it instead of counting it twice
+    cache = NodeCache(sum(sizes))
+    cache.put(nodes[0])
+    cache.put(dict(nodes[0]))
+    print "put replaces a cached node:",
+    print len(cache) == 1 and cache.size == sizes[0]
+
+    print "Nodes larger than the budget are not kept:",
+    cache = NodeCache(sizes[0] - 1)
+    cache.put(nodes[0])
+    print len(cache) == 0 and cache.size == 0
+
+    print "Hits and misses:",
+    cache = NodeCache(sum(sizes))
+    cache.put(nodes[0])
+    cache.get("age", 0)
+    cache.get("age", 1)
+    print cache.hits == 1 and cache.misses == 1
+
+    # invalidate_iname drops a whole tree and its root, leaving the others
+    cache = NodeCache(10 * sum(sizes))
+    for x in nodes:
+        cache.put(x)
+        cache.put(node("height", x["iname_id"]))
+    cache.set_root("age", 0)
+    cache.set_root("height", 0)
+    height_size = cache.size - sum(sizes)
+    cache.invalidate("height", 0)
+    print "invalidate:",
+    print ("height", 0) not in cache and len(cache) == 2*N - 1
+    cache.invalidate_iname("age")
+    print "invalidate_iname:",
+    print len(cache) == N - 1 and cache.get_root("age") is None and cache.get_root("height") == 0 and \
+          cache.size == height_size - len(BSON.encode(node("height", 0))) and \
+          all(("age", i) not in cache and ("height", i) in cache for i in range(1, N))
+
+    print "clear:",
+    cache.clear()
+    print len(cache) == 0 and cache.size == 0 and cache.get_root("height") is None
+
+    # A budget of 0 disables the cache
+    cache = NodeCache(0)
+    cache.put(nodes[0])
+    cache.set_root("age", 0)
+    print "Disabled cache:",
+    print len(cache) == 0 and cache.get_root("age") is None
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# coding:  utf-8
+
+from secmongo.crypto.paillier import Paillier, RandomnessPool
+from secmongo.crypto import arithmetic
+from fractions import gcd
+import random
+import copy
+
+# Decryption as it was before the CRT, modulo n^2 and only valid for
+# lambda = phi(n)
+def old_decrypt(keys, c):
+    n = keys["pub"]["n"]
+    l = keys["priv"]["lambda"]
+    mi = pow(l,l-1,n)
+    return ((pow(long(c),l,n*n) - 1)/n)*mi % n
+
+def main():
+    N = 200
+    keys = Paillier.keygen()
+    n = keys["pub"]["n"]
+    p = keys["priv"]["p"]
+    q = keys["priv"]["q"]
+    pts = [random.randrange(-n/2, n/2) for _ in range(N)] + [0, 1, -1, n-1, -(n-1)]
+
+    # Only the available backends are listed
+    for backend in sorted(arithmetic.BACKENDS):
+        print "Backend %s" % backend
+
+        # p and q as kept by keygen
+        cipher = Paillier(keys, backend = backend)
+        cts = [cipher.encrypt(m) for m in pts]
+        print "CRT decryption matches the old one:",
+        print all(cipher.decrypt(c) == old_decrypt(keys, c) == m % n for c, m in zip(cts, pts))
+        print "decrypt_many matches decrypt:",
+        print cipher.decrypt_many(cts) == [m % n for m in pts]
+
+        # Negative values are taken modulo n, so they can be added up
+        print "Negative values add up:",
+        print all(cipher.decrypt(cipher.h_operation(long(cipher.encrypt(a)), long(cipher.encrypt(-b)))) == (a - b) % n
+                  for a, b in zip(pts[:20], pts[20:40]))
+
+        # p and q recovered from n and lambda = phi(n)
+        phi_keys = copy.deepcopy(keys)
+        phi_keys["priv"].pop("p")
+        phi_keys["priv"].pop("q")
+        print "__factor recovers p and q:",
+        print sorted(Paillier._Paillier__factor(n, (p-1)*(q-1))) == sorted([p, q])
+        cipher = Paillier(phi_keys, backend = backend)
+        print "Decryption with recovered factors:",
+        print all(cipher.decrypt(c) == old_decrypt(keys, c) for c in cts)
+
+        # lambda = lcm(p-1, q-1) can't be factored, so decryption works
+        # modulo n^2
+        lcm_keys = copy.deepcopy(phi_keys)
+        lcm_keys["priv"]["lambda"] = (p-1)*(q-1)/gcd(p-1, q-1)
+        print "__factor rejects lcm(p-1, q-1):",
+        print Paillier._Paillier__factor(n, lcm_keys["priv"]["lambda"]) == (None, None)
+        cipher = Paillier(lcm_keys, backend = backend)
+        print "Decryption modulo n^2:",
+        print all(cipher.decrypt(c) == m % n for c, m in zip(cts, pts))
+        print "__factor rejects a bad lambda:",
+        print Paillier._Paillier__factor(n, (p-1)*(q-1) + 2) == (None, None)
+
+        # Pooled encryption
+        cipher = Paillier(keys, backend = backend)
+        cipher.start_pool(size = 16, threshold = 8)
+        cts = [cipher.encrypt(m) for m in pts]
+        print "Pooled encryption:",
+        print all(cipher.decrypt(c) == m % n for c, m in zip(cts, pts))
+        print "Pooled ciphertexts are randomised:",
+        print len(set(cipher.encrypt(7) for _ in range(N))) == N
+        cipher.stop_pool()
+
+        # A pool without workers runs dry and computes factors on demand
+        pool = RandomnessPool(n, size = 4, workers = 0, backend = backend)
+        factors = [pool.get() for _ in range(8)]
+        print "Exhausted pool draws on demand:",
+        print len(pool) == 0 and len(set(factors)) == len(factors)
+        print "Drawn factors are n-th residues:",
+        print all(old_decrypt(keys, r) == 0 for r in factors)
+        pool.stop()
+
+        # Domain values are encrypted from the stored g^m of their attribute
+        cipher = Paillier(keys, backend = backend)
+        domains = {"rating": range(6), "delta": range(-5, 1)}
+        for name, values in domains.items():
+            cipher.add_domain(name, values)
+        print "Domains are kept apart:",
+        print dict((name, sorted(values)) for name, values in cipher._Paillier__domains.items()) == domains
+        print "add_domain starts no pool:",
+        print cipher._Paillier__pool is None
+        print "Domain encryption:",
+        print all(cipher.decrypt(cipher.encrypt(m, domain = name)) == m % n
+                  for name in domains for m in range(-6, 7) * 5)
+        cipher.start_pool(size = 16, threshold = 8)
+        print "Pooled domain encryption:",
+        print all(cipher.decrypt(cipher.encrypt(m, domain = name)) == m % n
+                  for name in domains for m in range(-6, 7) * 5)
+        cipher.stop_pool()
+
+        # Packed counters are added up slot by slot
+        cipher = Paillier(keys, backend = backend)
+        slot_bits = Paillier.slot_bits_for(5, N)
+        counters = [[random.randrange(6) for _ in range(cipher.slots(slot_bits))] for _ in range(N)]
+        total = reduce(lambda a, b: cipher.h_operation(long(a), long(b)), [cipher.encrypt_packed(x, slot_bits) for x in counters])
+        print "Packed counters:",
+        print cipher.decrypt_packed(total, slot_bits) == [sum(x) for x in zip(*counters)]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# coding:  utf-8
+
+from secmongo.index import postings
+import random
+
+def roundtrip(ids, block_size = postings.BLOCK_SIZE):
+    return list(postings.decode(postings.encode(ids, block_size))) == sorted(set(ids))
+
+def main():
+    N = 100
+
+    print "Varints:",
+    ok = True
+    for x in [0, 1, 0x7f, 0x80, 0x3fff, 0x4000, 2**31, 2**64 + 1] + [random.randrange(2**40) for _ in range(N)]:
+        data = bytearray()
+        postings.encode_varint(x, data)
+        ok = ok and postings.decode_varint(data, 0) == (x, len(data))
+    print ok
+
+    # Sparse ids are stored as deltas and dense ones as bitmaps
+    sparse = random.sample(xrange(10**9), 1000)
+    dense = random.sample(xrange(5000), 4000)
+    print "Delta blocks:",
+    print roundtrip(sparse) and all(bytearray(b)[0] == postings.DELTAS for b in postings.encode(sparse))
+    print "Bitmap blocks:",
+    print roundtrip(dense) and all(bytearray(b)[0] == postings.BITMAP for b in postings.encode(dense))
+
+    print "Random round trips:",
+    print all(roundtrip([random.randrange(random.choice([2, 100, 10**4, 10**12])) for _ in range(random.randrange(1, 3000))],
+                        block_size = random.choice([1, 7, 128, postings.BLOCK_SIZE]))
+              for _ in range(N))
+    print "Single ids and duplicates:",
+    print roundtrip([0]) and roundtrip([2**40]) and roundtrip([5, 5, 3, 3, 3])
+    print "Empty list:",
+    print postings.encode([]) == [] and roundtrip([])
+
+    # Only non-negative integers can be compressed
+    print "compressible:",
+    print postings.compressible([0, 1, 2**40]) and not postings.compressible([1, -1]) and not postings.compressible(["a"])
+
+    print "union and intersect:",
+    ok = True
+    for _ in range(N):
+        sets = [set(random.sample(xrange(2000), random.randrange(0, 1500))) for _ in range(random.randrange(1, 4))]
+        streams = lambda: [postings.decode(postings.encode(s, 64)) for s in sets]
+        ok = ok and list(postings.union(*streams())) == sorted(sum([sorted(s) for s in sets], []))
+        ok = ok and list(postings.intersect(*streams())) == sorted(set.intersection(*sets))
+    print ok and list(postings.intersect()) == []
+
+if __name__ == '__main__':
+    main()